@@ -0,0 +1,115 @@
+import time
+import socket
+import argparse
+import statistics
+
+from benchmarks.common import write_results
+from benchmarks.server import LatencyServer
+from browser.resolver import Resolver, open_connection
+
+# NOTE: Connection establishment against a stand-in resolver, which answers
+# with chosen addresses after a chosen delay, and the loopback server. Each
+# scenario puts a bad address in front of a working one and times how long
+# open_connection takes to get through. The resolver cache is measured by
+# counting how many lookups reach the stand-in. Run with
+#   python -m benchmarks.bench_connect --output results.json
+
+# Documentation prefix, never routed: connecting either hangs or fails
+BLACKHOLE = "192.0.2.1"
+
+def closed_port():
+    # A port nothing listens on, so connecting is refused right away
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+def has_ipv6():
+    try:
+        s = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
+        s.bind(("::1", 0))
+        s.close()
+        return True
+    except OSError:
+        return False
+
+def stand_in(addresses, delay=0):
+    def lookup(host, port):
+        if delay:
+            time.sleep(delay)
+        return list(addresses)
+    return lookup
+
+def scenarios(port):
+    refused = closed_port()
+    result = {
+        "loopback": [(socket.AF_INET, ("127.0.0.1", port))],
+        "refused_first": [(socket.AF_INET, ("127.0.0.1", refused)),
+                          (socket.AF_INET, ("127.0.0.1", port))],
+        "blackhole_first": [(socket.AF_INET, (BLACKHOLE, port)),
+                            (socket.AF_INET, ("127.0.0.1", port))],
+        "blackhole_only": [(socket.AF_INET, (BLACKHOLE, port))],
+    }
+    if has_ipv6():
+        # The server only listens on IPv4, so the IPv6 attempt is refused
+        result["ipv6_refused_first"] = [(socket.AF_INET6, ("::1", port, 0, 0)),
+                                        (socket.AF_INET, ("127.0.0.1", port))]
+    return result
+
+def time_connects(resolver, port, repeat, timeout, delay):
+    times, errors = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            open_connection("stand-in.test", port, timeout=timeout, delay=delay,
+                            resolver=resolver).close()
+        except OSError as e:
+            errors.append(type(e).__name__)
+        times.append((time.perf_counter() - start) * 1000)
+    return {
+        "median_ms": round(statistics.median(times), 3),
+        "max_ms": round(max(times), 3),
+        "errors": errors,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="DNS cache and connection benchmark")
+    parser.add_argument("--output", help="JSON file to write, defaults to stdout")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=1.0,
+                        help="Connect timeout in seconds")
+    parser.add_argument("--attempt-delay", type=float, default=0.25,
+                        help="Seconds between connection attempts")
+    parser.add_argument("--lookup-delay", type=float, default=20,
+                        help="Stand-in resolver delay in milliseconds")
+    args = parser.parse_args()
+
+    results = {"connect": {}}
+    with LatencyServer({"/": b"ok"}) as server:
+        for name, addresses in scenarios(server.port).items():
+            resolver = Resolver(stand_in(addresses), name="dns-bench")
+            result = time_connects(resolver, server.port, args.repeat,
+                                   args.timeout, args.attempt_delay)
+            results["connect"][name] = result
+            print(f"{name}: median {result['median_ms']} ms, errors {len(result['errors'])}")
+
+        # The first connect pays for the lookup, the rest hit the cache
+        lookup = stand_in([(socket.AF_INET, ("127.0.0.1", server.port))],
+                          delay=args.lookup_delay / 1000)
+        cached = Resolver(lookup, name="dns-bench")
+        uncached = Resolver(lookup, ttl=0, name="dns-bench")
+        results["resolver_cache"] = {
+            "cached": time_connects(cached, server.port, args.repeat,
+                                    args.timeout, args.attempt_delay),
+            "cached_lookups": cached.lookups,
+            "uncached": time_connects(uncached, server.port, args.repeat,
+                                      args.timeout, args.attempt_delay),
+            "uncached_lookups": uncached.lookups,
+        }
+        print(f"resolver cache: {cached.lookups} vs {uncached.lookups} lookups")
+
+    write_results("connect", results, args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import time
+import pstats
+import cProfile
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import write_results
+from benchmarks.generate import generate
+from benchmarks.server import LatencyServer, Route, redirect_chain
+from browser.constants import MAX_REDIRECTS
+from browser.url import URL, cache, sockets
+
+# NOTE: Drives URL.request against the loopback server, one scenario per
+# feature of the network stack: plain keep-alive, chunked, gzip, redirect
+# chains and Cache-Control. Requests/sec and bytes/sec are measured on the
+# client, connection reuse is counted by the server. With --profile, the
+# client side of the run is profiled and the hottest functions are printed.
+# Run with
+#   python -m benchmarks.bench_network --output results.json
+
+PROFILE_LINES = 25
+
+def make_routes(body):
+    routes = {
+        "/plain": Route(body),
+        "/chunked": Route(body, chunk_size=4096),
+        "/small-chunks": Route(body, chunk_size=256),
+        "/gzip": Route(body, gzip=True),
+        "/gzip-chunked": Route(body, gzip=True, chunk_size=4096),
+        "/cached": Route(body, cache_control="max-age=60"),
+        "/no-store": Route(body, cache_control="max-age=60, no-store"),
+    }
+    return redirect_chain(routes, "/redirect", "/plain", MAX_REDIRECTS)
+
+SCENARIOS = ["plain", "chunked", "small-chunks", "gzip", "gzip-chunked",
+             "redirect", "cached", "no-store"]
+
+def run_scenario(routes, path, requests, concurrency, latency):
+    cache.clear()
+    sockets.clear()
+
+    with LatencyServer(routes, latency=latency) as server:
+        url = server.url(path)
+        def fetch(_):
+            return len(URL(url).request())
+
+        start = time.perf_counter()
+        if concurrency > 1:
+            with ThreadPoolExecutor(concurrency) as pool:
+                sizes = list(pool.map(fetch, range(requests)))
+        else:
+            sizes = [fetch(i) for i in range(requests)]
+        elapsed = time.perf_counter() - start
+        stats = server.stats()
+
+    stats.update({
+        "client_requests": requests,
+        "seconds": round(elapsed, 4),
+        "requests_per_sec": round(requests / elapsed, 1),
+        "bytes_per_sec": round(sum(sizes) / elapsed),
+    })
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Network stack throughput benchmark")
+    parser.add_argument("--output", help="JSON file to write, defaults to stdout")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--size", type=int, default=500,
+                        help="Response body size, in wide_list items")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0, help="Injected latency in ms")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS,
+                        help="Scenarios to run, defaults to all")
+    parser.add_argument("--profile", action="store_true",
+                        help="Profile the run and print the hottest functions")
+    parser.add_argument("--profile-output", help="Also write the raw profile here")
+    args = parser.parse_args()
+
+    body = generate("wide_list", args.size).encode("utf-8")
+    routes = make_routes(body)
+
+    # cProfile only sees the thread it was enabled on
+    profiler = cProfile.Profile() if args.profile or args.profile_output else None
+    if profiler:
+        if args.concurrency > 1:
+            print("Profiling runs requests on the main thread, ignoring --concurrency")
+            args.concurrency = 1
+        profiler.enable()
+
+    results = {}
+    for name in args.scenario or SCENARIOS:
+        result = run_scenario(routes, "/" + name, args.requests, args.concurrency,
+                              args.latency / 1000)
+        results[name] = result
+        print(f"{name}: {result['requests_per_sec']} req/s, "
+              f"{result['bytes_per_sec'] / 1e6:.1f} MB/s, reuse {result['reuse_rate']}")
+
+    if profiler:
+        profiler.disable()
+        if args.profile_output:
+            profiler.dump_stats(args.profile_output)
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(PROFILE_LINES)
+
+    write_results("network", {"body_bytes": len(body), "concurrency": args.concurrency,
+                              "latency_ms": args.latency, "scenarios": results}, args.output)
+
+if __name__ == "__main__":
+    main()
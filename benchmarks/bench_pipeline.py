@@ -0,0 +1,112 @@
+import argparse
+
+from benchmarks.common import measure, write_results, display, tk_root
+from benchmarks.generate import WORKLOADS, generate
+from browser.constants import WIDTH
+from browser.css_parser import CSSParser, cascade_priority, style
+from browser.html_parser import Element, HTMLParser, tree_to_list
+
+# NOTE: Times every stage of the pipeline on its own and then the whole
+# pipeline, for each synthetic workload. Run from anywhere with
+#   python -m benchmarks.bench_pipeline --output results.json
+
+
+class Tokenizer(HTMLParser):
+    # Runs the parser's lexer without building a tree
+    def __init__(self, body):
+        super().__init__(body)
+        self.tokens = 0
+
+    def add_text(self, text):
+        self.tokens += 1
+
+    def add_tag(self, tag):
+        self.tokens += 1
+
+    def finish(self):
+        return self.tokens
+
+def style_sheets(nodes):
+    return [node.children[0].text for node in tree_to_list(nodes, [])
+            if isinstance(node, Element) and node.tag == "style" and node.children]
+
+def page_rules(nodes, default_css):
+    rules = []
+    for css in [default_css] + style_sheets(nodes):
+        rules.extend(CSSParser(css).parse())
+    return sorted(rules, key=cascade_priority)
+
+def bench_workload(body, default_css, repeat, with_layout):
+    if with_layout:
+        from browser.layout import DocumentLayout, paint_tree, layout_cache
+
+    results = {}
+    results["tokenize"], _ = measure(lambda: Tokenizer(body).parse(), repeat)
+    results["HTMLParser.parse"], nodes = measure(lambda: HTMLParser(body).parse(), repeat)
+
+    css = "\n".join([default_css] + style_sheets(nodes))
+    results["CSSParser.parse"], _ = measure(lambda: CSSParser(css).parse(), repeat)
+
+    rules = page_rules(nodes, default_css)
+    results["style"], _ = measure(lambda: style(nodes, rules), repeat)
+
+    if with_layout:
+        document = DocumentLayout(nodes)
+        def cold_layout():
+            layout_cache.clear()
+            document.layout(WIDTH)
+        results["DocumentLayout.layout"], _ = measure(cold_layout, repeat)
+        # Every cacheable subtree is now in the layout cache
+        results["DocumentLayout.layout (cached)"], _ = measure(
+            lambda: document.layout(WIDTH), repeat)
+        results["layout_cache"] = layout_cache.stats()
+        results["paint_tree"], _ = measure(lambda: paint_tree(document, []), repeat)
+
+    def pipeline():
+        if with_layout:
+            layout_cache.clear()
+        nodes = HTMLParser(body).parse()
+        style(nodes, page_rules(nodes, default_css))
+        if with_layout:
+            document = DocumentLayout(nodes)
+            document.layout(WIDTH)
+            paint_tree(document, [])
+        return nodes
+
+    results["pipeline"], nodes = measure(pipeline, repeat)
+    results["nodes"] = len(tree_to_list(nodes, []))
+    results["bytes"] = len(body.encode("utf-8"))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-stage pipeline benchmarks")
+    parser.add_argument("--output", help="JSON file to write, defaults to stdout")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--size", type=int, default=1000,
+                        help="Workload size (items, rules or nesting depth)")
+    parser.add_argument("--workload", action="append", choices=sorted(WORKLOADS),
+                        help="Workloads to run, defaults to all")
+    args = parser.parse_args()
+
+    with open("data/browser.css", encoding="utf-8") as f:
+        default_css = f.read()
+
+    results = {}
+    with display() as has_display:
+        root = tk_root() if has_display else None
+        if not has_display:
+            print("No display available, skipping layout and paint stages")
+
+        for name in args.workload or sorted(WORKLOADS):
+            body = generate(name, args.size)
+            results[name] = bench_workload(body, default_css, args.repeat, has_display)
+            print(f"{name}: pipeline median {results[name]['pipeline']['median_ms']} ms")
+
+        if root:
+            root.destroy()
+
+    write_results("pipeline", {"size": args.size, "layout": has_display,
+                               "workloads": results}, args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import argparse
+
+import browser.loader
+from benchmarks.common import measure, write_results
+from benchmarks.server import LatencyServer
+from browser.loader import LoadTask, fetch_document
+from browser.url import URL, cache, sockets, request_pipelined
+
+# NOTE: Fetches a page's same-origin style sheets from a loopback server
+# with injected latency, one request at a time on a keep-alive connection
+# and pipelined on one connection, then loads the whole page both ways.
+# Caches and pooled connections are dropped before every run. Run with
+#   python -m benchmarks.bench_pipelining --output results.json
+
+def make_routes(sheets):
+    routes = {}
+    links = ""
+    for i in range(sheets):
+        routes[f"/style{i}.css"] = (f".item{i} {{ color: blue; }}\n" * 50).encode("utf-8")
+        links += f'<link rel="stylesheet" href="/style{i}.css">\n'
+    routes["/index.html"] = (f"<html><head>{links}</head>"
+                             "<body><p>Pipelining</p></body></html>").encode("utf-8")
+    return routes
+
+def reset():
+    cache.clear()
+    sockets.clear()
+
+def fetch_sequential(urls):
+    reset()
+    return [url.request() for url in urls]
+
+def fetch_pipelined(urls):
+    reset()
+    return request_pipelined(urls)
+
+def load_page(url, pipelining):
+    reset()
+    browser.loader.HTTP_PIPELINING = pipelining
+    return fetch_document(LoadTask(None, URL(url)))
+
+def check_fallback(routes, sheets):
+    # The server closes every connection after two responses, so most of
+    # each pipelined batch has to be requested again
+    with LatencyServer(routes, max_requests=2) as server:
+        urls = [URL(server.url(f"/style{i}.css")) for i in range(sheets)]
+        expected = fetch_sequential(urls)
+        return fetch_pipelined(urls) == expected
+
+def bench_latency(routes, sheets, latency, repeat):
+    with LatencyServer(routes, latency=latency) as server:
+        urls = [URL(server.url(f"/style{i}.css")) for i in range(sheets)]
+        sequential, expected = measure(lambda: fetch_sequential(urls), repeat)
+        pipelined, contents = measure(lambda: fetch_pipelined(urls), repeat)
+        assert contents == expected, "Pipelined responses differ"
+
+        page = server.url("/index.html")
+        page_sequential, _ = measure(lambda: load_page(page, False), repeat)
+        page_pipelined, _ = measure(lambda: load_page(page, True), repeat)
+
+    return {
+        "latency_ms": latency * 1000,
+        "sequential": sequential,
+        "pipelined": pipelined,
+        "speedup": round(sequential["median_ms"] / pipelined["median_ms"], 2),
+        "page_sequential": page_sequential,
+        "page_pipelined": page_pipelined,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP/1.1 pipelining benchmark")
+    parser.add_argument("--output", help="JSON file to write, defaults to stdout")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--sheets", type=int, default=8,
+                        help="Same-origin style sheets on the page")
+    parser.add_argument("--latency", type=float, action="append",
+                        help="Injected latency in milliseconds, defaults to 0, 10 and 50")
+    args = parser.parse_args()
+
+    routes = make_routes(args.sheets)
+    fallback_ok = check_fallback(routes, args.sheets)
+    print(f"Fallback after early close: {'ok' if fallback_ok else 'FAILED'}")
+
+    results = []
+    for latency in args.latency or [0, 10, 50]:
+        result = bench_latency(routes, args.sheets, latency / 1000, args.repeat)
+        results.append(result)
+        print(f"{latency} ms: sequential {result['sequential']['median_ms']} ms, "
+              f"pipelined {result['pipelined']['median_ms']} ms")
+
+    write_results("pipelining", {"sheets": args.sheets, "fallback_ok": fallback_ok,
+                                 "runs": results}, args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import time
+import argparse
+import statistics
+
+from benchmarks.common import percentiles, write_results, display, tk_root
+from benchmarks.generate import WORKLOADS, generate
+from browser.constants import WIDTH, HEIGHT, SCROLL_STEP
+
+# NOTE: Replays recorded display lists through Tab.draw with scripted scroll
+# sequences, on a real canvas (or a private Xvfb one), and reports per-frame
+# times and canvas item counts. Record pages while browsing with
+#   BROWSER_RECORD_DISPLAY_LISTS=recordings python main.py <url>
+# then replay them with
+#   python -m benchmarks.bench_replay --recording recordings/0001-....dl
+# Without recordings, the synthetic workloads are laid out, recorded and
+# read back first.
+
+MAX_FRAMES = 300
+
+def step_script(height, viewport):
+    return list(range(0, max(height - viewport, 0) + 1, SCROLL_STEP))
+
+def page_script(height, viewport):
+    return list(range(0, max(height - viewport, 0) + 1, viewport))
+
+def fling_script(height, viewport):
+    # Accelerates to the bottom, then jumps back to the top
+    positions, scroll, delta = [0], 0, SCROLL_STEP
+    while scroll < height - viewport:
+        scroll = min(scroll + delta, max(height - viewport, 0))
+        delta = int(delta * 1.5)
+        positions.append(scroll)
+    return positions + [0]
+
+def jitter_script(height, viewport):
+    # Small scrolls back and forth, mostly over content already on the canvas
+    # Bounces off either end of the page, instead of piling up positions
+    # past it that would all be clamped to the same frame
+    positions, scroll, direction = [], 0, 1
+    bottom = max(height - viewport, 0)
+    for i in range(MAX_FRAMES):
+        forward = i % 2 == 0
+        step = direction * (3 * SCROLL_STEP if forward else -2 * SCROLL_STEP)
+        if forward and not 0 <= scroll + step <= bottom:
+            direction = -direction
+        scroll = min(max(scroll + step, 0), bottom)
+        positions.append(scroll)
+    return positions
+
+SCRIPTS = {
+    "step": step_script,
+    "page": page_script,
+    "fling": fling_script,
+    "jitter": jitter_script,
+}
+
+def record_workload(name, size, width):
+    from browser.css_parser import CSSParser, cascade_priority, style
+    from browser.html_parser import HTMLParser
+    from browser.layout import DocumentLayout, paint_tree
+    from browser.display_list import serialize, deserialize
+
+    with open("data/browser.css", encoding="utf-8") as f:
+        rules = CSSParser(f.read()).parse()
+    nodes = HTMLParser(generate(name, size)).parse()
+    style(nodes, sorted(rules, key=cascade_priority))
+    document = DocumentLayout(nodes)
+    document.layout(width)
+    display_list = []
+    paint_tree(document, display_list)
+    data = serialize(display_list, f"workload:{name}", width, document.height)
+    return deserialize(data), len(data)
+
+def make_painter(kind, canvas):
+    if kind == "tiles":
+        from browser.raster import TilePainter
+        return TilePainter(canvas)
+    from browser.painter import RetainedPainter
+    return RetainedPainter(canvas)
+
+def replay(root, recording, script, painter_kind):
+    import tkinter
+    from browser.gui import Tab, display_versions
+    from browser.spatial import SpatialIndex, display_bounds
+
+    window = tkinter.Toplevel(root)
+    width = recording.width or WIDTH
+    canvas = tkinter.Canvas(window, width=width, height=HEIGHT, bg="white")
+    canvas.pack()
+    window.update()
+    painter = make_painter(painter_kind, canvas)
+
+    tab = Tab()
+    tab.document = recording.document
+    tab.display_list = recording.display_list
+    tab.display_index = SpatialIndex(recording.display_list, display_bounds)
+    tab.display_version = next(display_versions)
+
+    times, items = [], []
+    for scroll in SCRIPTS[script](recording.document.height, HEIGHT)[:MAX_FRAMES]:
+        start = time.perf_counter()
+        tab.scroll = scroll
+        canvas.delete("chrome")
+        tab.draw(painter, width, HEIGHT)
+        window.update_idletasks()
+        times.append((time.perf_counter() - start) * 1000)
+        items.append(len(canvas.find_all()))
+
+    window.destroy()
+    result = percentiles(times)
+    result["mean_items"] = round(statistics.fmean(items), 1)
+    result["max_items"] = max(items)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Display list replay benchmark")
+    parser.add_argument("--output", help="JSON file to write, defaults to stdout")
+    parser.add_argument("--recording", action="append",
+                        help="Recorded display list, defaults to the synthetic workloads")
+    parser.add_argument("--size", type=int, default=1000,
+                        help="Workload size, when no recording is given")
+    parser.add_argument("--script", action="append", choices=sorted(SCRIPTS),
+                        help="Scroll scripts to run, defaults to all")
+    parser.add_argument("--painter", choices=["retained", "tiles"], default="retained")
+    args = parser.parse_args()
+
+    results = {}
+    with display() as has_display:
+        if not has_display:
+            print("No display available, nothing to replay on")
+            write_results("replay", {"display": False}, args.output)
+            return
+
+        from browser.display_list import load_recording
+        root = tk_root()
+
+        recordings = {}
+        for path in args.recording or []:
+            recordings[path] = (load_recording(path), None)
+        if not args.recording:
+            for name in sorted(WORKLOADS):
+                recordings[name] = record_workload(name, args.size, WIDTH)
+
+        for name, (recording, size) in recordings.items():
+            results[name] = {"commands": len(recording.display_list),
+                             "height": recording.document.height}
+            if size is not None:
+                results[name]["recording_bytes"] = size
+            for script in args.script or sorted(SCRIPTS):
+                result = replay(root, recording, script, args.painter)
+                results[name][script] = result
+                print(f"{name} {script}: p50 {result['p50_ms']} ms, "
+                      f"p99 {result['p99_ms']} ms, up to {result['max_items']} items")
+        root.destroy()
+
+    write_results("replay", {"painter": args.painter, "recordings": results}, args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+from benchmarks.common import REPO_ROOT, summarize, write_results, display
+
+# NOTE: Every run is a fresh interpreter doing what main.py does. "cold"
+# runs get an empty cache directory (no compiled style sheet or emoji
+# atlas), "warm" runs share one.
+
+def probe(url, has_display):
+    start = time.perf_counter()
+    times = {}
+    def mark(name):
+        times[name] = round((time.perf_counter() - start) * 1000, 3)
+
+    from browser.url import URL
+    from browser.loader import LoadTask, start_task
+    task = start_task(LoadTask(None, URL(url)))
+    mark("load_started")
+
+    if not has_display:
+        task.finished.wait()
+        mark("page_fetched")
+        print(json.dumps(times))
+        return
+
+    from browser.gui import Browser
+    mark("gui_imported")
+    browser = Browser()
+    mark("window_created")
+    browser.new_tab(task.url, task)
+
+    def check():
+        if browser.active_tab.document:
+            browser.window.update()
+            mark("first_paint")
+            browser.window.destroy()
+        else:
+            browser.window.after(1, check)
+    browser.window.after(1, check)
+    browser.window.mainloop()
+    print(json.dumps(times))
+
+def run(url, cache_dir, has_display):
+    env = dict(os.environ, XDG_CACHE_HOME=cache_dir)
+    command = [sys.executable, "-m", "benchmarks.bench_startup", "--probe", url]
+    if not has_display:
+        command.append("--no-display")
+
+    start = time.perf_counter()
+    output = subprocess.run(command, cwd=REPO_ROOT, env=env, check=True,
+                            capture_output=True, text=True).stdout
+    times = json.loads(output.strip().splitlines()[-1])
+    times["process"] = round((time.perf_counter() - start) * 1000, 3)
+    return times
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold and warm startup benchmark")
+    parser.add_argument("--output", help="JSON file to write, defaults to stdout")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--url", default="file://data/homepage.html")
+    parser.add_argument("--probe", help=argparse.SUPPRESS)
+    parser.add_argument("--no-display", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.probe:
+        probe(args.probe, not args.no_display)
+        return
+
+    results = {}
+    with display() as has_display, tempfile.TemporaryDirectory() as warm_cache:
+        if not has_display:
+            print("No display available, timing up to the fetched page only")
+        run(args.url, warm_cache, has_display)
+
+        for mode in ["cold", "warm"]:
+            runs = []
+            for _ in range(args.repeat):
+                if mode == "cold":
+                    with tempfile.TemporaryDirectory() as cold_cache:
+                        runs.append(run(args.url, cold_cache, has_display))
+                else:
+                    runs.append(run(args.url, warm_cache, has_display))
+            results[mode] = {name: summarize([times[name] for times in runs])
+                             for name in runs[0]}
+            print(f"{mode}: process median {results[mode]['process']['median_ms']} ms")
+
+    write_results("startup", {"url": args.url, "display": has_display,
+                              "modes": results}, args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import statistics
+import subprocess
+from contextlib import contextmanager
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The browser loads data/ with relative paths
+os.chdir(REPO_ROOT)
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+def measure(fn, repeat):
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return summarize(times), result
+
+def summarize(times_ms):
+    return {
+        "runs": len(times_ms),
+        "min_ms": round(min(times_ms), 3),
+        "median_ms": round(statistics.median(times_ms), 3),
+        "mean_ms": round(statistics.fmean(times_ms), 3),
+    }
+
+def percentiles(times_ms):
+    ordered = sorted(times_ms)
+    def at(p):
+        return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))], 3)
+    return {"frames": len(ordered), "p50_ms": at(50), "p95_ms": at(95), "p99_ms": at(99)}
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def write_results(name, results, output):
+    report = {
+        "benchmark": name,
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": int(time.time()),
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"Wrote {output}")
+    else:
+        print(text)
+
+# NOTE: Layout measures text with Tk fonts, which needs an X display. Without
+# one, a private Xvfb server is started if it is installed.
+@contextmanager
+def display():
+    if os.environ.get("DISPLAY") or platform.system() != "Linux":
+        yield True
+        return
+
+    xvfb = shutil.which("Xvfb")
+    if not xvfb:
+        yield False
+        return
+
+    number = 90 + os.getpid() % 100
+    server = subprocess.Popen(
+        [xvfb, f":{number}", "-screen", "0", "1280x1024x24", "-nolisten", "tcp"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    os.environ["DISPLAY"] = f":{number}"
+    try:
+        time.sleep(0.5)
+        yield server.poll() is None
+    finally:
+        del os.environ["DISPLAY"]
+        server.terminate()
+        server.wait()
+
+def tk_root():
+    import tkinter
+    from browser.css_parser import init_fonts
+    root = tkinter.Tk()
+    root.withdraw()
+    init_fonts(root)
+    return root
@@ -0,0 +1,90 @@
+import random
+
+# NOTE: Synthetic pages for the benchmarks. Every generator is deterministic
+# for a given size, so results are comparable across commits.
+
+WORDS = ("lorem ipsum dolor sit amet consectetur adipiscing elit sed do "
+         "eiusmod tempor incididunt ut labore et dolore magna aliqua").split()
+ENTITIES = ["&amp;", "&lt;", "&gt;", "&quot;", "&nbsp;", "&copy;", "&eacute;", "&hellip;"]
+EMOJI = ["\U0001F600", "\U0001F680", "\U0001F389", "❤️", "\U0001F44D", "\U0001F30D"]
+
+def sentence(rng, words=12):
+    return " ".join([rng.choice(WORDS) for _ in range(words)])
+
+def page(body, css=""):
+    head = f"<head><style>{css}</style></head>" if css else ""
+    return f"<!doctype html><html>{head}<body>{body}</body></html>"
+
+def deep_dom(size):
+    # Parser, style and layout all recurse per level, so stay well below
+    # Python's recursion limit
+    depth = min(size, 150)
+    rng = random.Random(depth)
+    opening = "".join(["<div>" for _ in range(depth)])
+    closing = "".join(["</div>" for _ in range(depth)])
+    return page(opening + f"<p>{sentence(rng)}</p>" + closing)
+
+def wide_list(size):
+    rng = random.Random(size)
+    items = "".join([f"<li>{sentence(rng, 6)}</li>" for _ in range(size)])
+    return page(f"<ul>{items}</ul>")
+
+def entity_text(size):
+    rng = random.Random(size)
+    paragraphs = []
+    for _ in range(size // 10 + 1):
+        words = [rng.choice(WORDS + ENTITIES) for _ in range(40)]
+        paragraphs.append(f"<p>{' '.join(words)}</p>")
+    return page("".join(paragraphs))
+
+def large_stylesheet(size):
+    rng = random.Random(size)
+    tags = ["div", "p", "span", "b", "i", "section", "article", "nav"]
+    rules = []
+    for i in range(size):
+        selector = f"{rng.choice(tags)} .c{i % 50} {rng.choice(tags)}"
+        rules.append(f"{selector} {{ color: #{rng.randrange(0x1000000):06x}; }}")
+    body = "".join([
+        f"<section class=\"c{i % 50}\"><div><p>{sentence(rng)} <b>{sentence(rng, 3)}</b></p></div></section>"
+        for i in range(size // 10 + 1)])
+    return page(body, "\n".join(rules))
+
+def emoji_rich(size):
+    rng = random.Random(size)
+    paragraphs = []
+    for _ in range(size // 10 + 1):
+        words = [rng.choice(WORDS + EMOJI) for _ in range(30)]
+        paragraphs.append(f"<p>{' '.join(words)}</p>")
+    return page("".join(paragraphs))
+
+def site_chrome(size):
+    # The same navigation and footer around every article, like a page of
+    # embedded posts or a feed
+    rng = random.Random(size)
+    nav = "".join([f"<li><a href=\"/{i}\">Section {i}</a></li>" for i in range(8)])
+    chrome = f"<nav><ul>{nav}</ul></nav>"
+    footer = "".join([f"<p>Footer link {i} and legal text</p>" for i in range(6)])
+    articles = "".join([
+        f"<div>{chrome}<article><p>{sentence(rng, 30)}</p></article><footer>{footer}</footer></div>"
+        for _ in range(size // 20 + 1)])
+    return page(articles)
+
+WORKLOADS = {
+    "deep_dom": deep_dom,
+    "wide_list": wide_list,
+    "entity_text": entity_text,
+    "large_stylesheet": large_stylesheet,
+    "emoji_rich": emoji_rich,
+    "site_chrome": site_chrome,
+}
+
+def generate(name, size):
+    return WORKLOADS[name](size)
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Write a synthetic page to stdout")
+    parser.add_argument("workload", choices=sorted(WORKLOADS))
+    parser.add_argument("--size", type=int, default=1000)
+    args = parser.parse_args()
+    print(generate(args.workload, args.size))
@@ -0,0 +1,173 @@
+import gzip
+import time
+import queue
+import socket
+import threading
+
+# NOTE: A loopback HTTP/1.1 server for network benchmarks. Every connection
+# gets a reader thread, which timestamps each request as it arrives, and a
+# writer thread, which sends the response `latency` seconds after that
+# arrival. Requests on one connection are answered in order, like a real
+# server, but their latencies overlap, so the delay behaves like a round
+# trip rather than like server work.
+
+
+class Route:
+    # How one path is served. Bodies are bytes; gzip compresses them once,
+    # chunk_size sends them with chunked transfer encoding, and location
+    # makes the route a redirect
+    def __init__(self, body=b"", chunk_size=None, gzip=False, cache_control=None,
+                 location=None):
+        self.body = body
+        self.chunk_size = chunk_size
+        self.gzip = gzip
+        self.cache_control = cache_control
+        self.location = location
+        self.encoded = None
+
+    def payload(self):
+        if self.encoded is None:
+            self.encoded = gzip.compress(self.body) if self.gzip else self.body
+        return self.encoded
+
+def redirect_chain(routes, path, target, hops):
+    # Adds routes so that `path` reaches `target` after `hops` redirects
+    for hop in range(hops):
+        location = target if hop == hops - 1 else f"{path}-{hop + 1}"
+        routes[path if hop == 0 else f"{path}-{hop}"] = Route(location=location)
+    return routes
+
+
+class LatencyServer:
+    def __init__(self, routes, latency=0.0, max_requests=None):
+        # Key: path, value: response body (bytes) or Route
+        self.routes = routes
+        self.latency = latency
+        # Connections are closed after this many responses, like servers
+        # with a keep-alive limit
+        self.max_requests = max_requests
+        self.connections = 0
+        self.requests = 0
+        self.lock = threading.Lock()
+
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(64)
+        self.port = self.listener.getsockname()[1]
+        self.running = False
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.port}{path}"
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self.accept, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.running = False
+        self.listener.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def accept(self):
+        while self.running:
+            try:
+                conn, _ = self.listener.accept()
+            except OSError:
+                return
+            with self.lock:
+                self.connections += 1
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            pending = queue.Queue()
+            threading.Thread(target=self.read, args=(conn, pending), daemon=True).start()
+            threading.Thread(target=self.write, args=(conn, pending), daemon=True).start()
+
+    def read(self, conn, pending):
+        stream = conn.makefile("rb")
+        try:
+            while True:
+                requestline = stream.readline()
+                if not requestline: break
+                arrival = time.perf_counter()
+                while stream.readline() not in (b"\r\n", b"\n", b""):
+                    pass
+                method, path, version = requestline.decode("utf-8").split(" ", 2)
+                pending.put((arrival, path))
+        except (OSError, ValueError):
+            pass
+        pending.put(None)
+
+    def write(self, conn, pending):
+        served = 0
+        try:
+            while True:
+                request = pending.get()
+                if request is None: break
+                arrival, path = request
+                delay = arrival + self.latency - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+                served += 1
+                last = self.max_requests is not None and served >= self.max_requests
+                conn.sendall(self.response(path, last))
+                with self.lock:
+                    self.requests += 1
+                if last: break
+        except OSError:
+            pass
+        try:
+            conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        conn.close()
+
+    def stats(self):
+        with self.lock:
+            requests, connections = self.requests, self.connections
+        return {
+            "requests": requests,
+            "connections": connections,
+            # Share of requests that didn't need a new connection
+            "reuse_rate": round(1 - connections / requests, 4) if requests else 0,
+        }
+
+    def response(self, path, last):
+        route = self.routes.get(path)
+        if route is None:
+            route = Route(b"Not found")
+            status = "404 Not Found"
+        elif isinstance(route, bytes):
+            route = Route(route)
+            status = "200 OK"
+        else:
+            status = "302 Found" if route.location else "200 OK"
+
+        body = route.payload()
+        headers = [f"HTTP/1.1 {status}"]
+        if route.location:
+            headers.append(f"Location: {route.location}")
+        if route.gzip:
+            headers.append("Content-Encoding: gzip")
+        if route.cache_control:
+            headers.append(f"Cache-Control: {route.cache_control}")
+        if last:
+            headers.append("Connection: close")
+
+        if route.chunk_size:
+            headers.append("Transfer-Encoding: chunked")
+            chunks = []
+            for start in range(0, len(body), route.chunk_size):
+                chunk = body[start:start + route.chunk_size]
+                chunks.append(f"{len(chunk):x}\r\n".encode("utf-8") + chunk + b"\r\n")
+            chunks.append(b"0\r\n\r\n")
+            body = b"".join(chunks)
+        else:
+            headers.append(f"Content-Length: {len(body)}")
+        return ("\r\n".join(headers) + "\r\n\r\n").encode("utf-8") + body
@@ -0,0 +1,186 @@
+import sys
+import time
+import threading
+from collections import OrderedDict
+
+from browser.constants import CACHE_MEMORY_BUDGET, CACHE_ENFORCE_BYTES
+
+def default_size(key, value):
+    return sys.getsizeof(key) + sys.getsizeof(value)
+
+
+class ManagedCache:
+    # NOTE: An LRU dict with optional per-entry TTL, an entry or byte limit of
+    # its own, and hit/miss/eviction counters. Every cache is registered with
+    # `registry`, which evicts across caches to stay within one global budget.
+    # `tk_bound` caches hold Tk objects, which may only be freed on the Tk
+    # (main) thread, so other threads never evict from them. `tk_only` caches
+    # are only ever used from the Tk thread, so their lookups skip the lock.
+    def __init__(self, name, size=default_size, ttl=None, max_entries=None,
+                 max_bytes=None, on_evict=None, tk_bound=False, tk_only=False):
+        self.name = name
+        self.estimate = size
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self.tk_bound = tk_bound or tk_only
+
+        # Key: cache key, value: (value, size, expiry time or None)
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.RLock()
+        if tk_only:
+            self.get = self.lookup
+        registry.register(self)
+
+    def get(self, key, default=None):
+        with self.lock:
+            return self.lookup(key, default)
+
+    def lookup(self, key, default=None):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        value, _, expires = entry
+        if expires is not None and expires < time.monotonic():
+            self.evict(key)
+            self.misses += 1
+            return default
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value, ttl=None):
+        ttl = ttl if ttl is not None else self.ttl
+        size = self.estimate(key, value)
+        with self.lock:
+            # A replaced value is released like an evicted one, e.g. a socket
+            # returned to the pool while another one was already waiting there
+            replaced = self.remove(key)
+            if replaced and replaced[0] is not value and self.on_evict:
+                self.on_evict(key, replaced[0])
+            expires = time.monotonic() + ttl if ttl is not None else None
+            self.entries[key] = (value, size, expires)
+            self.size += size
+
+            while self.entries and (
+                    (self.max_entries is not None and len(self.entries) > self.max_entries) or
+                    (self.max_bytes is not None and self.size > self.max_bytes)):
+                self.evict(next(iter(self.entries)))
+        registry.added(size)
+
+    def pop(self, key, default=None):
+        with self.lock:
+            value = self.get(key, default)
+            self.remove(key)
+            return value
+
+    def setdefault(self, key, value):
+        with self.lock:
+            current = self.get(key)
+            if current is not None:
+                return current
+            self.put(key, value)
+            return value
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry:
+            self.size -= entry[1]
+        return entry
+
+    def evict(self, key):
+        entry = self.remove(key)
+        if entry:
+            self.evictions += 1
+            if self.on_evict:
+                self.on_evict(key, entry[0])
+
+    def evict_oldest(self):
+        with self.lock:
+            if not self.entries: return False
+            self.evict(next(iter(self.entries)))
+            return True
+
+    def clear(self):
+        with self.lock:
+            for key in list(self.entries):
+                self.evict(key)
+
+    def __contains__(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            return entry is not None and (entry[2] is None or entry[2] >= time.monotonic())
+
+    def __getitem__(self, key):
+        value = self.get(key, KeyError)
+        if value is KeyError:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.put(key, value)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def items(self):
+        with self.lock:
+            return [(key, entry[0]) for key, entry in self.entries.items()]
+
+    def values(self):
+        return [value for _, value in self.items()]
+
+    def stats(self):
+        return {
+            "count": len(self.entries),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class CacheRegistry:
+    def __init__(self, budget):
+        self.budget = budget
+        # Key: cache name
+        self.caches = {}
+        # Bytes put since the budget was last checked
+        self.pending = 0
+
+    def register(self, cache):
+        self.caches[cache.name] = cache
+
+    def size(self):
+        return sum([cache.size for cache in list(self.caches.values())])
+
+    # Summing every cache's size on each put would cost more than most
+    # lookups, so the budget is only checked every CACHE_ENFORCE_BYTES
+    def added(self, size):
+        self.pending += size
+        if self.pending < CACHE_ENFORCE_BYTES: return
+        self.pending = 0
+        self.enforce()
+
+    # Evicts least recently used entries from the largest caches first
+    def enforce(self):
+        if self.size() <= self.budget: return
+        on_tk_thread = threading.current_thread() is threading.main_thread()
+        candidates = [cache for cache in self.caches.values()
+                      if on_tk_thread or not cache.tk_bound]
+
+        while self.size() > self.budget and candidates:
+            largest = max(candidates, key=lambda cache: cache.size)
+            if not largest.evict_oldest():
+                candidates.remove(largest)
+
+    def stats(self):
+        return {name: cache.stats() for name, cache in self.caches.items()}
+
+registry = CacheRegistry(CACHE_MEMORY_BUDGET)
@@ -1,3 +1,5 @@
+import os
+
 
 SCROLL_STEP = 100
 WIDTH, HEIGHT = 800, 600
@@ -6,3 +8,86 @@ HSTEP, VSTEP = 13, 18
 SCROLLBAR_WIDTH = 12
 
 MAX_REDIRECTS = 3
+
+# Height in pixels of the y-buckets used by the spatial index
+SPATIAL_BUCKET_HEIGHT = 128
+
+# Retained painter: content within PAINT_MARGIN screens of the viewport gets
+# canvas items, and once more than PAINTER_MAX_ITEMS exist, items further
+# than EVICT_MARGIN screens away are deleted
+PAINT_MARGIN = 1
+EVICT_MARGIN = 3
+PAINTER_MAX_ITEMS = 5000
+
+# Frame scheduler: target frame length in seconds, and how many frames a
+# smooth scroll is spread over
+FRAME_INTERVAL = 1 / 60
+SMOOTH_SCROLL = False
+SMOOTH_SCROLL_FRAMES = 6
+
+# Directory for data that is derived once and reused across runs
+CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "yeet-browser")
+
+EMOJI_SIZE = 20
+
+# view-source: pages are painted in blocks of this many lines
+SOURCE_BLOCK_LINES = 64
+
+# Layout results of blocks with LAYOUT_CACHE_MIN_NODES to
+# LAYOUT_CACHE_MAX_NODES DOM nodes are reused for identical subtrees; at
+# most LAYOUT_CACHE_ENTRIES are kept. Nested blocks each store their own
+# copy, so bigger subtrees would cost more to record than they save
+LAYOUT_CACHE_MIN_NODES = 10
+LAYOUT_CACHE_MAX_NODES = 500
+LAYOUT_CACHE_ENTRIES = 2000
+
+# Optional raster path: the display list is drawn into TILE_SIZE x TILE_SIZE
+# images by RASTER_WORKERS threads, and up to TILE_CACHE_BUDGET bytes of
+# tiles are kept around
+RASTER_TILES = False
+TILE_SIZE = 256
+RASTER_WORKERS = 4
+TILE_CACHE_BUDGET = 64 * 1024 * 1024
+
+# Tab hibernation: background tabs idle for TAB_DISCARD_AFTER seconds, or
+# the least recently used ones once all tabs together hold more than
+# TAB_OBJECT_BUDGET DOM nodes, layout objects and draw commands, are reduced
+# to a snapshot. The check runs every TAB_DISCARD_CHECK_MS
+TAB_DISCARD_AFTER = 5 * 60
+TAB_OBJECT_BUDGET = 500_000
+TAB_DISCARD_CHECK_MS = 10_000
+
+# Back/forward cache: per tab, at most HISTORY_CACHE_PAGES pages holding
+# HISTORY_CACHE_OBJECTS DOM nodes, layout objects and draw commands in total
+HISTORY_CACHE_PAGES = 5
+HISTORY_CACHE_OBJECTS = 200_000
+
+# Speculation: links under the pointer or in the viewport get a warm
+# connection (and hovered ones a prefetch) from SPECULATION_WORKERS threads,
+# at most once per SPECULATION_TTL seconds. Prefetched responses without
+# their own max-age are kept for PREFETCH_MAX_AGE seconds, for one request
+SPECULATION_WORKERS = 2
+SPECULATION_TTL = 30
+PREFETCH_MAX_AGE = 30
+
+# All caches registered with the cache manager share this many bytes, and
+# the budget is checked again after every CACHE_ENFORCE_BYTES added to them
+CACHE_MEMORY_BUDGET = 256 * 1024 * 1024
+CACHE_ENFORCE_BYTES = 1024 * 1024
+# Pooled connections idle for longer than this are closed
+SOCKET_IDLE_TIMEOUT = 60
+
+# HTTP/1.1 pipelining of same-origin stylesheets, off by default since some
+# servers and proxies mishandle it. At most PIPELINE_DEPTH requests are sent
+# back to back on one connection
+HTTP_PIPELINING = False
+PIPELINE_DEPTH = 8
+
+# Resolved addresses are reused for DNS_TTL seconds. Connection attempts to
+# a host's addresses start CONNECT_ATTEMPT_DELAY seconds apart and all give
+# up after CONNECT_TIMEOUT seconds
+DNS_TTL = 60
+CONNECT_TIMEOUT = 10
+CONNECT_ATTEMPT_DELAY = 0.25
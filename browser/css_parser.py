@@ -1,5 +1,9 @@
+import os
+import re
+import pickle
+import hashlib
 from browser.html_parser import Element
-import tkinter.font as tkfont
+from browser.constants import CACHE_DIR
 
 INHERITED_PROPERTIES = {
     "font-family": "sans-serif",
@@ -11,6 +15,7 @@ INHERITED_PROPERTIES = {
 
 SYSTEM_FONTS = set()
 def init_fonts(root):
+    import tkinter.font as tkfont
     global SYSTEM_FONTS
     SYSTEM_FONTS = set(tkfont.families(root))
 
@@ -224,3 +229,48 @@ class CSSParser:
             else:
                 self.i += 1
         return None
+
+def parser_version():
+    # Pickled rules are instances of this module's classes, so any change to
+    # it (parser or selectors) must invalidate them
+    with open(__file__, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()[:12]
+
+# NOTE: Parsed rules of a style sheet file are pickled into CACHE_DIR, keyed
+# by the file's modification time and size and by this module's source, so
+# later runs skip parsing it
+def load_style_sheet(path):
+    stat = os.stat(path)
+    name = os.path.basename(path).replace(".", "-")
+    compiled = os.path.join(
+        CACHE_DIR, f"{name}-{stat.st_mtime_ns}-{stat.st_size}-{parser_version()}.pickle")
+
+    try:
+        with open(compiled, "rb") as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        pass
+
+    with open(path, "r", encoding="utf-8") as f:
+        rules = CSSParser(f.read()).parse()
+
+    try: # Parsing again next time is fine if the cache can't be written
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(compiled + ".tmp", "wb") as f:
+            pickle.dump(rules, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(compiled + ".tmp", compiled)
+        remove_stale_pickles(name, compiled)
+    except OSError as e:
+        print(f"Error caching {path}: {e}")
+    return rules
+
+def remove_stale_pickles(name, current):
+    # Every edit of the file or the parser leaves a pickle under a new key
+    stale = re.compile(re.escape(name) + r"-\d+-\d+-[0-9a-f]{12}\.pickle")
+    for filename in os.listdir(CACHE_DIR):
+        path = os.path.join(CACHE_DIR, filename)
+        if stale.fullmatch(filename) and path != current:
+            try: # Another browser may be removing it too
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,119 @@
+import os
+import re
+import json
+import zlib
+import itertools
+
+from browser.draw import DrawText, DrawRect, DrawEmoji, DrawLines
+
+FORMAT_VERSION = 1
+
+# NOTE: Display lists are stored as zlib-compressed JSON. Fonts are written
+# once to a font table (their Tk configuration) and referenced by index, and
+# every command is a short list starting with its kind:
+#   ["text", x, y, text, font, color]
+#   ["rect", x1, y1, x2, y2, color]
+#   ["emoji", x, y, name]
+#   ["lines", x, y, text, line count, font, color]
+# Reading a recording creates Tk fonts, so it must happen on the Tk thread.
+
+def serialize(display_list, url="", width=0, height=0):
+    fonts = []
+    # Key: Tk font name, value: index into fonts
+    font_index = {}
+    def font_ref(font):
+        if font.name not in font_index:
+            font_index[font.name] = len(fonts)
+            fonts.append(font.configure())
+        return font_index[font.name]
+
+    commands = []
+    for cmd in display_list:
+        if isinstance(cmd, DrawText):
+            commands.append(["text", cmd.left, cmd.top, cmd.text, font_ref(cmd.font), cmd.color])
+        elif isinstance(cmd, DrawRect):
+            commands.append(["rect", cmd.left, cmd.top, cmd.right, cmd.bottom, cmd.color])
+        elif isinstance(cmd, DrawEmoji):
+            commands.append(["emoji", cmd.left, cmd.top, cmd.emoji])
+        elif isinstance(cmd, DrawLines):
+            lines = round((cmd.bottom - cmd.top) / cmd.linespace)
+            commands.append(["lines", cmd.left, cmd.top, cmd.text, lines,
+                             font_ref(cmd.font), cmd.color])
+
+    recording = {
+        "version": FORMAT_VERSION,
+        "url": url,
+        "width": width,
+        "height": height,
+        "fonts": fonts,
+        "commands": commands,
+    }
+    return zlib.compress(json.dumps(recording, separators=(",", ":")).encode("utf-8"))
+
+
+class RecordedDocument:
+    # Stands in for a DocumentLayout when a recording is drawn by a Tab
+    def __init__(self, height):
+        self.height = height
+        self.children = []
+
+
+class Recording:
+    def __init__(self, url, width, height, display_list):
+        self.url = url
+        self.width = width
+        self.document = RecordedDocument(height)
+        self.display_list = display_list
+
+def deserialize(data):
+    from browser.layout import get_font
+
+    recording = json.loads(zlib.decompress(data).decode("utf-8"))
+    if recording.get("version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported display list version: {recording.get('version')}")
+
+    fonts = [get_font(font["family"], font["size"], font["weight"], font["slant"])
+             for font in recording["fonts"]]
+
+    display_list = []
+    for cmd in recording["commands"]:
+        kind = cmd[0]
+        if kind == "text":
+            _, x, y, text, font, color = cmd
+            display_list.append(DrawText(x, y, text, fonts[font], color))
+        elif kind == "rect":
+            _, x1, y1, x2, y2, color = cmd
+            display_list.append(DrawRect(x1, y1, x2, y2, color))
+        elif kind == "emoji":
+            _, x, y, name = cmd
+            display_list.append(DrawEmoji(x, y, name))
+        elif kind == "lines":
+            _, x, y, text, lines, font, color = cmd
+            display_list.append(DrawLines(x, y, text, 0, len(text), lines, fonts[font], color))
+
+    return Recording(recording["url"], recording["width"], recording["height"], display_list)
+
+def load_recording(path):
+    with open(path, "rb") as f:
+        return deserialize(f.read())
+
+
+class DisplayListRecorder:
+    # NOTE: Writes the display list of every loaded page to `directory`, one
+    # numbered file per load, for replaying with benchmarks/bench_replay.py
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.enabled = directory is not None
+        self.counter = itertools.count(1)
+
+    def record(self, url, width, height, display_list):
+        if not self.enabled: return None
+        os.makedirs(self.directory, exist_ok=True)
+        name = re.sub(r"[^\w.-]+", "_", str(url))[:80]
+        path = os.path.join(self.directory, f"{next(self.counter):04d}-{name}.dl")
+        with open(path, "wb") as f:
+            f.write(serialize(display_list, str(url), width, height))
+        return path
+
+# Setting BROWSER_RECORD_DISPLAY_LISTS=<directory> records every load
+recorder = DisplayListRecorder(os.environ.get("BROWSER_RECORD_DISPLAY_LISTS"))
@@ -1,5 +1,10 @@
-from PIL import ImageTk, Image
-emoji_cache = {}
+from browser.emoji_atlas import get_atlas
+from browser.constants import EMOJI_SIZE
+from browser.cache_manager import ManagedCache
+
+# Key: emoji name (codepoint sequence), value: Tk PhotoImage
+emoji_cache = ManagedCache(
+    "emoji_images", size=lambda key, value: EMOJI_SIZE * EMOJI_SIZE * 4, tk_bound=True)
 
 
 class DrawText:
@@ -11,13 +16,58 @@ class DrawText:
         self.color = color
         self.bottom = y1 + font.metrics("linespace")
 
-    def execute(self, scroll, canvas):
-        canvas.create_text(
+    def execute(self, scroll, canvas, tags=()):
+        return canvas.create_text(
+            self.left, self.top - scroll,
+            text=self.text,
+            font=self.font,
+            fill=self.color,
+            anchor="nw",
+            tags=tags)
+
+    def rasterize(self, image, draw, fonts, dx, dy):
+        draw.text(
+            (self.left + dx, self.top + dy),
+            self.text,
+            font=fonts[self.font.name],
+            fill=self.color)
+
+
+class DrawLines:
+    # NOTE: A block of preformatted lines. It keeps offsets into the source
+    # and only slices its text out when drawn, so off-screen blocks of a
+    # huge source cost no more than their position
+    def __init__(self, x1, y1, source, start, end, lines, font, color):
+        self.top = y1
+        self.left = x1
+        self.source = source
+        self.start = start
+        self.end = end
+        self.font = font
+        self.color = color
+        self.linespace = font.metrics("linespace")
+        self.bottom = y1 + lines * self.linespace
+
+    @property
+    def text(self):
+        return self.source[self.start:self.end]
+
+    def execute(self, scroll, canvas, tags=()):
+        return canvas.create_text(
             self.left, self.top - scroll,
             text=self.text,
             font=self.font,
             fill=self.color,
-            anchor="nw")
+            anchor="nw",
+            tags=tags)
+
+    def rasterize(self, image, draw, fonts, dx, dy):
+        for i, line in enumerate(self.text.split("\n")):
+            draw.text(
+                (self.left + dx, self.top + dy + i * self.linespace),
+                line,
+                font=fonts[self.font.name],
+                fill=self.color)
 
 
 class DrawRect:
@@ -28,34 +78,46 @@ class DrawRect:
         self.right = x2
         self.color = color
 
-    def execute(self, scroll, canvas):
-        canvas.create_rectangle(
+    def execute(self, scroll, canvas, tags=()):
+        return canvas.create_rectangle(
             self.left, self.top - scroll,
             self.right, self.bottom - scroll,
             width=0,
+            fill=self.color,
+            tags=tags)
+
+    def rasterize(self, image, draw, fonts, dx, dy):
+        draw.rectangle(
+            (self.left + dx, self.top + dy,
+             self.right + dx - 1, self.bottom + dy - 1),
             fill=self.color)
 
 
 class DrawEmoji:
     def __init__(self, x1, y1, emoji):
-        self.size = 20
+        self.size = EMOJI_SIZE
         self.top = y1
         self.left = x1
         self.bottom = y1 + self.size
         self.emoji = emoji
 
-    def execute(self, scroll, canvas):
-        codepoints = []
-        for char in self.emoji:
-            # Format specifier: hexadecimal, 4 digits, zero-padding
-            codepoints.append("{:04x}".format(ord(char)).upper())
-        emoji_png = "-".join(codepoints)
+    def execute(self, scroll, canvas, tags=()):
+        photo = emoji_cache.get(self.emoji)
+        if photo is None:
+            from PIL import ImageTk
+            sprite = get_atlas(self.size).sprite(self.emoji)
+            photo = ImageTk.PhotoImage(sprite)
+            emoji_cache[self.emoji] = photo
+        # Tk drops the image once Python stops referencing it, so keep it
+        # alive for as long as this command might be on the canvas
+        self.photo = photo
 
-        if emoji_png not in emoji_cache:
-            image = Image.open(f"data/openmoji-72x72-color/{emoji_png}.png")
-            emoji_cache[emoji_png] = ImageTk.PhotoImage(image.resize((self.size, self.size)))
-
-        canvas.create_image(
+        return canvas.create_image(
             self.left, self.top - scroll,
             anchor="nw",
-            image=emoji_cache[emoji_png])
+            image=photo,
+            tags=tags)
+
+    def rasterize(self, image, draw, fonts, dx, dy):
+        sprite = get_atlas(self.size).sprite(self.emoji)
+        image.paste(sprite, (int(self.left + dx), int(self.top + dy)), sprite)
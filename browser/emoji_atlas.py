@@ -0,0 +1,130 @@
+import os
+import json
+import queue
+import threading
+
+from browser.constants import CACHE_DIR
+from browser.cache_manager import ManagedCache
+
+EMOJI_DIR = "data/openmoji-72x72-color"
+ATLAS_COLUMNS = 64
+
+# Codepoint sequences (e.g. "1F1E9-1F1F0") that have an image, built the
+# first time a page contains non-ASCII text
+EMOJI_INDEX = None
+
+def get_emoji_index():
+    global EMOJI_INDEX
+    if EMOJI_INDEX is None:
+        EMOJI_INDEX = frozenset(
+            filename[:-len(".png")] for filename in os.listdir(EMOJI_DIR)
+            if filename.endswith(".png"))
+    return EMOJI_INDEX
+
+def emoji_name(word):
+    # Every emoji with an image contains at least one non-ASCII codepoint
+    if word.isascii(): return None
+    index = get_emoji_index()
+    # Format specifier: hexadecimal, 4 digits, zero-padding
+    name = "-".join(["{:04X}".format(ord(char)) for char in word])
+    if name in index:
+        return name
+    # Some images are only stored without the emoji presentation selector
+    name = name.replace("-FE0F", "")
+    return name if name in index else None
+
+
+class EmojiAtlas:
+    # NOTE: All emoji images for one size are resized once and packed into a
+    # single sheet, which is stored in CACHE_DIR and reused by later runs.
+    # Sprites are cut out of the sheet by a worker thread as layout finds
+    # them, so painting never opens or resamples a PNG.
+    def __init__(self, size):
+        self.size = size
+        self.names = sorted(get_emoji_index())
+        self.positions = {name: i for i, name in enumerate(self.names)}
+        self.sheet = None
+        self.sprites = ManagedCache(
+            f"emoji_sprites_{size}", size=lambda name, sprite: size * size * 4)
+        self.lock = threading.Lock()
+        self.requests = queue.Queue()
+
+        path = os.path.join(CACHE_DIR, f"emoji-atlas-{size}")
+        self.sheet_path = path + ".png"
+        self.index_path = path + ".json"
+
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def preload(self, name):
+        if name not in self.sprites:
+            self.requests.put(name)
+
+    def sprite(self, name):
+        sprite = self.sprites.get(name)
+        if sprite is None:
+            with self.lock:
+                sprite = self.decode(name)
+            self.sprites[name] = sprite
+        return sprite
+
+    def decode(self, name):
+        from PIL import Image
+        if self.sheet is None:
+            image = Image.open(f"{EMOJI_DIR}/{name}.png").convert("RGBA")
+            return image.resize((self.size, self.size))
+
+        row, column = divmod(self.positions[name], ATLAS_COLUMNS)
+        x, y = column * self.size, row * self.size
+        return self.sheet.crop((x, y, x + self.size, y + self.size))
+
+    def run(self):
+        sheet = self.load_sheet()
+        if sheet is None:
+            threading.Thread(target=self.build_sheet, daemon=True).start()
+        else:
+            self.sheet = sheet
+
+        while True:
+            self.sprite(self.requests.get())
+
+    def load_sheet(self):
+        from PIL import Image
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                if json.load(f) != self.names:
+                    return None
+            sheet = Image.open(self.sheet_path)
+            sheet.load()
+            return sheet.convert("RGBA")
+        except (OSError, ValueError):
+            return None
+
+    def build_sheet(self):
+        from PIL import Image
+        rows = (len(self.names) + ATLAS_COLUMNS - 1) // ATLAS_COLUMNS
+        sheet = Image.new("RGBA", (ATLAS_COLUMNS * self.size, rows * self.size))
+        for i, name in enumerate(self.names):
+            image = Image.open(f"{EMOJI_DIR}/{name}.png").convert("RGBA")
+            row, column = divmod(i, ATLAS_COLUMNS)
+            sheet.paste(image.resize((self.size, self.size)),
+                        (column * self.size, row * self.size))
+
+        with self.lock:
+            self.sheet = sheet
+
+        try: # The atlas still works for this run if it can't be cached
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            sheet.save(self.sheet_path + ".tmp", format="PNG")
+            os.replace(self.sheet_path + ".tmp", self.sheet_path)
+            with open(self.index_path, "w", encoding="utf-8") as f:
+                json.dump(self.names, f)
+        except OSError as e:
+            print(f"Error caching emoji atlas: {e}")
+
+# Key: sprite size in pixels
+atlases = {}
+
+def get_atlas(size):
+    if size not in atlases:
+        atlases[size] = EmojiAtlas(size)
+    return atlases[size]
@@ -1,19 +1,34 @@
 import tkinter as tk
 import platform
-
-from browser.css_parser import CSSParser, cascade_priority, style, init_fonts
-from browser.layout import DocumentLayout, paint_tree, Text
-from browser.html_parser import Element, HTMLParser
-from browser.constants import SCROLL_STEP, WIDTH, HEIGHT, VSTEP, SCROLLBAR_WIDTH
-from browser.url import URL
-
-DEFAULT_STYLE_SHEET = CSSParser(open("data/browser.css").read()).parse()
-
-def tree_to_list(tree, list):
-    list.append(tree)
-    for child in tree.children:
-        tree_to_list(child, list)
-    return list
+import itertools
+import time
+
+from browser.css_parser import init_fonts
+from browser.layout import DocumentLayout, TextLayout, paint_tree, Text
+from browser.html_parser import tree_to_list
+from browser.constants import SCROLL_STEP, WIDTH, HEIGHT, VSTEP, SCROLLBAR_WIDTH, \
+    SMOOTH_SCROLL, RASTER_TILES, TAB_DISCARD_AFTER, TAB_OBJECT_BUDGET, TAB_DISCARD_CHECK_MS
+from browser.url import URL, about_pages
+from browser.spatial import SpatialIndex, display_bounds, layout_bounds
+from browser.painter import RetainedPainter
+from browser.scheduler import FrameScheduler
+from browser.loader import LoadTask, PageLoader, fetch_document
+from browser.snapshot import take_snapshot, restore_nodes
+from browser.history import SessionHistory, CachedPage
+from browser.speculation import Speculator
+from browser.trace import tracer
+from browser.memory import memory_page, memory_tracker
+from browser.display_list import recorder
+
+# Every new display list gets a new version, so painters know when to redraw
+display_versions = itertools.count()
+
+def find_link(node):
+    while node:
+        if not isinstance(node, Text) and node.tag == "a" and "href" in node.attributes:
+            return node
+        node = node.parent
+    return None
 
 
 class Browser:
@@ -30,12 +45,21 @@ class Browser:
                                 height=self.height,
                                 bg="white")
         self.canvas.pack(fill=tk.BOTH, expand=1)
+        if RASTER_TILES:
+            from browser.raster import TilePainter
+            self.painter = TilePainter(self.canvas)
+        else:
+            self.painter = RetainedPainter(self.canvas)
 
         self.system_platform = platform.system()
+        self.scheduler = FrameScheduler(self.window, self.render, SMOOTH_SCROLL)
+        self.loader = PageLoader(self.window, self.handle_loaded)
+        self.speculator = Speculator(lambda: self.loader.in_flight > 0)
 
         self.window.bind("<Down>", self.handle_down)
         self.window.bind("<Up>", self.handle_up)
         self.window.bind("<Button-1>", self.handle_click)
+        self.window.bind("<Motion>", self.handle_motion)
         # TEST: Is this necesarry on windows or mac?
         if self.system_platform == "Linux":
             self.window.bind("<Button-5>", self.handle_scroll_linux)
@@ -43,111 +67,288 @@ class Browser:
         else:
             self.window.bind("<MouseWheel>", self.handle_scroll_mouse)
         self.window.bind("<Configure>", self.handle_resize)
-
-    def new_tab(self, url):
+        self.window.bind("<F3>", self.handle_frame_stats)
+        self.window.bind("<F4>", self.handle_toggle_trace)
+        self.window.bind("<F6>", self.handle_memory_page)
+        about_pages["memory"] = lambda: memory_page(self)
+        self.window.bind("<Control-Tab>", self.handle_next_tab)
+        self.window.bind("<Alt-Left>", self.handle_back)
+        self.window.bind("<Alt-Right>", self.handle_forward)
+
+        self.window.after(TAB_DISCARD_CHECK_MS, self.check_discards)
+
+    # `task` is an already started load of `url`, see main.py
+    def new_tab(self, url, task=None):
         new_tab = Tab()
-        new_tab.load(url, self.width)
         self.active_tab = new_tab
         self.tabs.append(new_tab)
+        if task:
+            self.loader.adopt(new_tab, task)
+        else:
+            self.navigate(new_tab, url)
+        self.draw()
+
+    def activate_tab(self, tab):
+        self.active_tab = tab
+        tab.last_active = time.monotonic()
+        if tab.snapshot and not tab.restore(self.width):
+            self.navigate(tab, tab.snapshot.url, tab.history.current())
+            tab.snapshot = None
+        elif tab.width != self.width:
+            tab.resize(self.width)
         self.draw()
 
+    def check_discards(self):
+        now = time.monotonic()
+        background = [tab for tab in self.tabs
+                      if tab is not self.active_tab and tab.document and not tab.loading]
+
+        for tab in background:
+            if now - tab.last_active > TAB_DISCARD_AFTER:
+                tab.discard()
+
+        live = sum([tab.object_count() for tab in self.tabs if tab.document])
+        for tab in sorted(background, key=lambda tab: tab.last_active):
+            if live <= TAB_OBJECT_BUDGET: break
+            if not tab.document: continue
+            live -= tab.object_count()
+            tab.discard()
+
+        self.window.after(TAB_DISCARD_CHECK_MS, self.check_discards)
+
+    def navigate(self, tab, url, entry=None):
+        self.speculator.cancel()
+        self.loader.load(tab, url, entry)
+
+    def handle_loaded(self, task):
+        task.tab.commit(task.url, task.nodes, self.width, task.entry)
+        memory_tracker.navigated(task.url)
+        if task.tab is self.active_tab:
+            self.draw()
+            self.speculate_viewport()
+
+    def speculate_viewport(self):
+        for url in self.active_tab.visible_links(self.height):
+            self.speculator.hint(url)
+
     def draw(self):
-        self.canvas.delete("all")
-        self.active_tab.draw(self.canvas, self.width, self.height)
+        self.canvas.delete("chrome")
+        self.active_tab.draw(self.painter, self.width, self.height)
+
+    def render(self, scroll, size, clicks):
+        if size and size != (self.width, self.height):
+            self.width, self.height = size
+            self.active_tab.resize(self.width)
+        # Clicks refer to the frame on screen, so they go before pending scrolls
+        for x, y in clicks:
+            url = self.active_tab.link_at(x, y)
+            if url:
+                self.navigate(self.active_tab, url)
+        if scroll:
+            self.active_tab.scroll_by(scroll, self.height)
+        self.draw()
+        if scroll:
+            self.speculate_viewport()
 
     def handle_resize(self, e):
-        self.width, self.height = e.width, e.height
-        self.active_tab.resize(self.width)
-        self.draw()
+        self.scheduler.resize(e.width, e.height)
 
+    # NOTE: Darwin and Windows scrolling not tested
     def handle_scroll_mouse(self, e):
-        self.active_tab.scrollmouse(e.delta, self.system_platform)
-        self.draw()
+        if self.system_platform == "Windows":
+            delta = -1 * (e.delta // 120)
+        elif self.system_platform == "Darwin":
+            delta = e.delta
+        else:
+            delta = 0
+        self.scheduler.scroll(delta * SCROLL_STEP)
 
     def handle_scroll_linux(self, e):
         if e.num == 5:
-            self.active_tab.scrolldown(self.height)
+            self.scheduler.scroll(SCROLL_STEP)
         elif e.num == 4:
-            self.active_tab.scrollup()
-        self.draw()
+            self.scheduler.scroll(-SCROLL_STEP)
 
     def handle_click(self, e):
-        self.active_tab.click(e.x, e.y, self.width)
-        self.draw()
+        self.scheduler.click(e.x, e.y)
+
+    def handle_motion(self, e):
+        if not self.active_tab.speculates(): return
+        url = self.active_tab.link_at(e.x, e.y)
+        if url:
+            self.speculator.hint(url, prefetch=True)
 
     def handle_down(self, _):
-        self.active_tab.scrolldown(self.height)
-        self.draw()
+        self.scheduler.scroll(SCROLL_STEP)
 
     def handle_up(self, _):
-        self.active_tab.scrollup()
+        self.scheduler.scroll(-SCROLL_STEP)
+
+    def handle_frame_stats(self, _):
+        print(f"Frames: {self.scheduler.report()}")
+
+    def handle_toggle_trace(self, _):
+        if tracer.enabled:
+            tracer.disable()
+            tracer.export(f"trace-{int(time.time())}.json")
+        else:
+            tracer.enable()
+            print("Tracing started, press F4 again to export")
+
+    def handle_memory_page(self, _):
+        self.new_tab(URL("about:memory"))
+
+    def go(self, offset):
+        tab = self.active_tab
+        entry = tab.go(offset, self.width)
+        if entry:
+            self.navigate(tab, entry.url, entry)
         self.draw()
 
+    def handle_back(self, _):
+        self.go(-1)
+
+    def handle_forward(self, _):
+        self.go(1)
+
+    def handle_next_tab(self, _):
+        index = self.tabs.index(self.active_tab)
+        self.activate_tab(self.tabs[(index + 1) % len(self.tabs)])
+
 
 class Tab:
     def __init__(self):
         self.blank = False
         self.nodes = []
-        self.document: DocumentLayout
+        self.document = None
         self.url: URL
         self.scroll = 0
+        self.width = None
+        self.node_count = 0
+        self.loading = None
+        self.snapshot = None
+        self.history = SessionHistory()
+        self.last_active = time.monotonic()
+        self.clear()
+
+    def clear(self):
+        self.document = None
+        self.display_list = []
+        self.display_index = SpatialIndex([], display_bounds)
+        self.display_version = next(display_versions)
+        self.layout_index = SpatialIndex([], layout_bounds)
 
-    # FIX: Not debounced -> Performance: poor
     def resize(self, width):
-        self.document.layout(width)
-        self.display_list = []
-        paint_tree(self.document, self.display_list)
+        if not self.document: return
+        self.width = width
+        self.layout(width)
+        self.paint()
 
-    def draw(self, canvas, width, height):
-        for cmd in self.display_list:
-            if cmd.top > self.scroll + height: continue
-            if cmd.bottom < self.scroll: continue
-            cmd.execute(self.scroll, canvas)
+    def layout(self, width):
+        with tracer.span("DocumentLayout.layout", width=width):
+            self.document.layout(width)
 
-        if self.document.height > height:
-            self.draw_scrollbar(canvas,  width, height)
+    def object_count(self):
+        return self.node_count + len(self.layout_index.items) + len(self.display_list)
 
+    def discard(self):
+        self.snapshot = take_snapshot(self)
+        self.history.clear_cache()
+        self.nodes = []
+        self.node_count = 0
+        self.clear()
+
+    def restore(self, width):
+        snapshot = self.snapshot
+        if not snapshot.dom:
+            return False
+        self.snapshot = None
+        self.commit(snapshot.url, restore_nodes(snapshot), width,
+                    self.history.current())
+        self.scroll = snapshot.scroll
+        return True
+
+    def paint(self):
+        with tracer.span("paint_tree") as span:
+            self.display_list = []
+            paint_tree(self.document, self.display_list)
+            span.set(draw_commands=len(self.display_list))
+
+        with tracer.span("SpatialIndex") as span:
+            self.display_index = SpatialIndex(self.display_list, display_bounds)
+            self.display_version = next(display_versions)
+            layout_objects = tree_to_list(self.document, [])
+            self.layout_index = SpatialIndex(layout_objects, layout_bounds)
+            if tracer.enabled:
+                span.set(layout_objects=len(layout_objects), words=len(
+                    [obj for obj in layout_objects if isinstance(obj, TextLayout)]))
+
+    def draw(self, painter, width, height):
+        with tracer.span("Tab.draw", scroll=self.scroll):
+            painter.paint(self.display_list, self.display_index,
+                          self.display_version, self.scroll, width, height)
+
+        if self.document and self.document.height > height:
+            self.draw_scrollbar(painter.canvas, width, height)
+
+    # NOTE: Blocks until the page is loaded, `PageLoader` is the async path
     def load(self, url, width):
+        self.commit(url, fetch_document(LoadTask(self, url)), width)
+
+    def commit(self, url, nodes, width, entry=None):
+        self.save_page()
+        if entry:
+            self.history.move_to(entry)
+        else:
+            entry = self.history.push(url)
+
         self.url = url
-        body = url.request()
+        self.scroll = 0
 
-        if not body:
+        if not nodes:
             self.blank = True
-            self.display_list = []
+            self.nodes = []
+            self.clear()
             return
 
-        if url.view_source:
-            parser = HTMLParser("")
-            parser.add_tag("pre")
-            for word in body.split(" "):
-                parser.add_text(word + " ")
-            self.nodes = parser.finish()
-        else:
-            self.nodes = HTMLParser(body).parse()
-
-        rules = DEFAULT_STYLE_SHEET.copy()
-
-        for node in tree_to_list(self.nodes, []):
-            if not isinstance(node, Element): continue
-            if node.tag == "link" and node.attributes.get("rel") == "stylesheet" and \
-                    "href" in node.attributes:
-                link = node.attributes["href"]
-                style_url = url.resolve(link)
-                try: # Ingores style sheets that fail to download
-                    body = style_url.request()
-                except Exception as e:
-                    print(f"Error downloading {style_url}: {e}")
-                    continue
-                rules.extend(CSSParser(body).parse())
-            elif node.tag == "style" and node.children:
-                rules.extend(CSSParser(node.children[0].text).parse())
-
-        style(self.nodes, sorted(rules, key=cascade_priority))
-        self.scroll = 0
+        self.blank = False
+        self.nodes = nodes
+        self.node_count = len(tree_to_list(nodes, []))
+        self.width = width
         self.document = DocumentLayout(self.nodes)
-        self.document.layout(width)
-        self.display_list = []
-        paint_tree(self.document, self.display_list)
+        self.layout(width)
+        self.paint()
+        recorder.record(url, width, self.document.height, self.display_list)
+        self.scroll = entry.scroll
+
+    def save_page(self):
+        entry = self.history.current()
+        if not entry or not self.document: return
+        entry.scroll = self.scroll
+        self.history.store(entry, CachedPage(self))
+
+    # Returns the history entry to load if it isn't cached
+    def go(self, offset, width):
+        entry = self.history.peek(offset)
+        if not entry: return None
+
+        page = self.history.take(entry)
+        if not page:
+            tracer.count("History cache misses")
+            return entry
+        tracer.count("History cache hits")
+
+        if self.loading:
+            self.loading.cancel()
+            self.loading = None
+        self.save_page()
+        self.history.move_to(entry)
+        self.url = entry.url
+        page.apply(self)
+        self.scroll = entry.scroll
+        if self.width != width:
+            self.resize(width)
+        return None
 
     def draw_scrollbar(self, canvas, width, height):
         percent_shown = height / self.document.height # visible content
@@ -160,41 +361,41 @@ class Tab:
         y0 = percent_offset * height
         y1 = y0 + scrollbar_height
 
-        canvas.create_rectangle(x0, y0, x1, y1, fill="blue")
-
-    def click(self, x, y, width):
-        y += self.scroll
-
-        objs = [obj for obj in tree_to_list(self.document, [])
-                if obj.x <= x < obj.x + obj.width
-                and obj.y <= y < obj.y + obj.height]
-        if not objs: return
-
-        elt = objs[-1].node
-        while elt:
-            if isinstance(elt, Text):
-                pass
-            elif elt.tag == "a" and "href" in elt.attributes:
-                url = self.url.resolve(elt.attributes["href"])
-                return self.load(url, width)
-            elt = elt.parent
-
-    def scrollup(self):
-        self.scroll = max(0, self.scroll - SCROLL_STEP)
-
-    def scrolldown(self, height):
+        canvas.create_rectangle(x0, y0, x1, y1, fill="blue", tags="chrome")
+
+    # Returns the URL of the link at the given window position
+    def link_at(self, x, y):
+        obj = self.layout_index.hit_test(x, y + self.scroll)
+        if not obj: return None
+
+        link = find_link(obj.node)
+        if not link: return None
+        return self.resolve_link(link)
+
+    def resolve_link(self, link):
+        # A bad href, or one relative to a data: or about: page, isn't
+        # followed instead of raising inside a Tk callback
+        try:
+            return self.url.resolve(link.attributes["href"])
+        except (AttributeError, ValueError):
+            return None
+
+    # Only pages fetched over http(s) get their links speculated on
+    def speculates(self):
+        url = getattr(self, "url", None)
+        return url is not None and not url.is_malformed and not url.view_source \
+            and url.scheme in ["http", "https"]
+
+    def visible_links(self, height):
+        if not self.speculates(): return []
+        links = {}
+        for obj in self.layout_index.query(self.scroll, self.scroll + height):
+            link = find_link(obj.node)
+            if link and id(link) not in links:
+                links[id(link)] = self.resolve_link(link)
+        return [url for url in links.values() if url]
+
+    def scroll_by(self, delta, height):
+        if not self.document: return
         max_y = max(self.document.height + 2*VSTEP - height, 0)
-        self.scroll = min(self.scroll + SCROLL_STEP, max_y)
-
-    # NOTE: Darwin and Windows scrolling not tested
-    # It's currently possible to scroll past bottom
-    def scrollmouse(self, delta, platform):
-        if platform == "Windows":
-            delta = -1 * (delta // 120)
-        elif platform == "Darwin":
-            delta = delta
-        else:
-            delta = 0
-
-        self.scroll += delta * SCROLL_STEP
-        self.scroll = max(0, self.scroll)
+        self.scroll = min(max(self.scroll + delta, 0), max_y)
@@ -0,0 +1,90 @@
+from collections import OrderedDict
+from browser.constants import HISTORY_CACHE_PAGES, HISTORY_CACHE_OBJECTS
+
+
+class HistoryEntry:
+    def __init__(self, url):
+        self.url = url
+        self.scroll = 0
+
+    def __repr__(self) -> str:
+        return f"HistoryEntry(url={self.url} scroll={self.scroll})"
+
+
+class CachedPage:
+    # NOTE: Everything `Tab.commit` produces for a page, kept so going back
+    # or forward doesn't need the network, parsing, style or layout
+    def __init__(self, tab):
+        self.nodes = tab.nodes
+        self.node_count = tab.node_count
+        self.width = tab.width
+        self.document = tab.document
+        self.display_list = tab.display_list
+        self.display_index = tab.display_index
+        self.display_version = tab.display_version
+        self.layout_index = tab.layout_index
+
+    def object_count(self):
+        return self.node_count + len(self.layout_index.items) + len(self.display_list)
+
+    def apply(self, tab):
+        tab.blank = False
+        tab.nodes = self.nodes
+        tab.node_count = self.node_count
+        tab.width = self.width
+        tab.document = self.document
+        tab.display_list = self.display_list
+        tab.display_index = self.display_index
+        tab.display_version = self.display_version
+        tab.layout_index = self.layout_index
+
+
+class SessionHistory:
+    def __init__(self):
+        self.entries = []
+        self.index = -1
+        # Key: HistoryEntry, in least recently stored order
+        self.cache = OrderedDict()
+        self.cached_objects = 0
+
+    def current(self):
+        return self.entries[self.index] if self.entries else None
+
+    def peek(self, offset):
+        index = self.index + offset
+        if 0 <= index < len(self.entries):
+            return self.entries[index]
+        return None
+
+    def push(self, url):
+        for entry in self.entries[self.index + 1:]:
+            self.take(entry)
+        del self.entries[self.index + 1:]
+
+        entry = HistoryEntry(url)
+        self.entries.append(entry)
+        self.index += 1
+        return entry
+
+    def move_to(self, entry):
+        self.index = self.entries.index(entry)
+
+    def store(self, entry, page):
+        self.take(entry)
+        self.cache[entry] = page
+        self.cached_objects += page.object_count()
+
+        while len(self.cache) > HISTORY_CACHE_PAGES or \
+                (self.cache and self.cached_objects > HISTORY_CACHE_OBJECTS):
+            _, evicted = self.cache.popitem(last=False)
+            self.cached_objects -= evicted.object_count()
+
+    def take(self, entry):
+        page = self.cache.pop(entry, None)
+        if page:
+            self.cached_objects -= page.object_count()
+        return page
+
+    def clear_cache(self):
+        self.cache.clear()
+        self.cached_objects = 0
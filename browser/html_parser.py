@@ -10,6 +10,10 @@ class Text:
     def __repr__(self) -> str:
         return repr(self.text)
 
+class SourceText(Text):
+    # The whole source of a view-source: page, laid out line by line
+    pass
+
 class Element:
     def __init__(self, tag, attributes, parent):
         self.tag = tag
@@ -27,14 +31,27 @@ class Element:
             return f"<{self.tag}>"
 
 
-with open("data/entities.json", "r", encoding="utf-8") as f:
-    ENTITY_MAP = json.load(f)
+ENTITY_MAP = None
+
+# The entity table is large, so it's only read once a page uses an entity
+def get_entity_map():
+    global ENTITY_MAP
+    if ENTITY_MAP is None:
+        with open("data/entities.json", "r", encoding="utf-8") as f:
+            ENTITY_MAP = json.load(f)
+    return ENTITY_MAP
 
 def print_tree(node, indent=0):
     print(" " * indent, node)
     for child in node.children:
         print_tree(child, indent + 2)
 
+def tree_to_list(tree, list):
+    list.append(tree)
+    for child in tree.children:
+        tree_to_list(child, list)
+    return list
+
 class HTMLParser:
     SELF_CLOSING_TAGS = [
         "area", "base", "br", "meta", "col", "hr", "img", "wbr",
@@ -76,8 +93,9 @@ class HTMLParser:
                 m = re.search(r"&.*?;", self.body[i:])
                 if m:
                     entity = m.group(0)
-                    if entity in ENTITY_MAP:
-                        buffer += ENTITY_MAP[entity]["characters"]
+                    entity_map = get_entity_map()
+                    if entity in entity_map:
+                        buffer += entity_map[entity]["characters"]
                     i += len(entity) - 1
             elif not in_comment:
                 buffer += c
@@ -160,3 +178,13 @@ class HTMLParser:
                 value = match.group("value")
                 attributes[name] = value.strip("\"'") if value else ""
         return tag, attributes
+
+
+def source_tree(source):
+    # NOTE: view-source: pages are a single <pre> holding the source as one
+    # node, instead of a Text node (and a trip through implicit_tags) per word
+    parser = HTMLParser("")
+    parser.add_tag("pre")
+    pre = parser.unfinished[-1]
+    pre.children.append(SourceText(source, pre))
+    return parser.finish()
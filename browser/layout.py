@@ -1,33 +1,120 @@
-import emoji
 from browser.css_parser import check_available_fonts
-from browser.draw import DrawRect, DrawText, DrawEmoji
-from browser.constants import WIDTH, HSTEP, VSTEP, SCROLLBAR_WIDTH
-from browser.html_parser import Text, Element
+from browser.draw import DrawRect, DrawText, DrawEmoji, DrawLines
+from browser.constants import WIDTH, HSTEP, VSTEP, SCROLLBAR_WIDTH, EMOJI_SIZE, \
+    SOURCE_BLOCK_LINES, LAYOUT_CACHE_MIN_NODES, LAYOUT_CACHE_MAX_NODES, \
+    LAYOUT_CACHE_ENTRIES
+from browser.emoji_atlas import emoji_name, get_atlas
+from browser.html_parser import Text, Element, SourceText, tree_to_list
+import re
+from browser.cache_manager import ManagedCache
 import tkinter.font
 
-font_cache = {}
-measure_cache = {}
+# Rough size of a Tk font plus the label keeping it alive
+FONT_SIZE_ESTIMATE = 4096
+
+# Up to SOURCE_BLOCK_LINES lines, the last one without its newline
+SOURCE_BLOCK = re.compile(r"(?:[^\n]*\n){1,%d}|[^\n]+$" % SOURCE_BLOCK_LINES)
+
+font_cache = ManagedCache("fonts", size=lambda key, value: FONT_SIZE_ESTIMATE,
+                          tk_only=True)
+measure_cache = ManagedCache("measure", tk_only=True)
+# Key: (subtree hash, subtree size, width), value: layout template. Templates
+# hold Tk fonts, so they're only freed on the Tk thread
+layout_cache = ManagedCache(
+    "layout", size=lambda key, template: 200 * (len(template[2]) + 1),
+    max_entries=LAYOUT_CACHE_ENTRIES, tk_only=True)
+# Keys laid out once so far. Most subtrees never repeat, so a template is
+# only recorded the second time its key comes up
+layout_seen = ManagedCache(
+    "layout_seen", size=lambda key, value: 100, max_entries=4 * LAYOUT_CACHE_ENTRIES,
+    tk_only=True)
 
 def get_font(family, size, weight, style):
     if style == "oblique": style = "italic"
     key = (family, size, weight, style)
-    if key not in font_cache:
+    cached = font_cache.get(key)
+    if cached is None:
         font = tkinter.font.Font(
             family=family,
             size=size,
             weight=weight,
             slant=style)
         label = tkinter.Label(font=font)
-        font_cache[key] = (font, label)
-    return font_cache[key][0]
+        cached = (font, label)
+        font_cache[key] = cached
+    return cached[0]
 
 def get_measure(word, family, size, weight, style, font=None):
     key = (word, family, size, weight, style)
-    if key not in measure_cache:
+    measure = measure_cache.get(key)
+    if measure is None:
         font = font if font else get_font(family, size, weight, style)
         measure = font.measure(word)
         measure_cache[key] = measure
-    return measure_cache[key]
+    return measure
+
+def hash_tree(node):
+    # NOTE: Structural hash of a subtree: tags, text and computed styles,
+    # which is all layout reads. Stored on every node with the subtree size
+    # and its total text length. The hash is Python's 64-bit hash(), so two
+    # different subtrees could collide; templates also check the root tag
+    # and text length, which makes a wrong reuse unlikely but not impossible
+    child_hashes = tuple([hash_tree(child) for child in node.children])
+    style = tuple(sorted(getattr(node, "style", {}).items()))
+    own = node.text if isinstance(node, Text) else node.tag
+    node.layout_hash = hash((type(node).__name__, own, style, child_hashes))
+    node.subtree_size = 1 + sum([child.subtree_size for child in node.children])
+    node.subtree_text = (len(node.text) if isinstance(node, Text) else 0) + \
+        sum([child.subtree_text for child in node.children])
+    return node.layout_hash
+
+# Attributes linking layout objects, rebuilt when a template is applied
+LINK_ATTRIBUTES = ("node", "parent", "previous", "children")
+
+def make_template(block):
+    # NOTE: Every layout object below `block` in preorder, as its class, the
+    # preorder index of its node, the indices of its parent and previous
+    # sibling (-1 is the block itself) and its other attributes, with x and
+    # y relative to the block
+    node_index = {id(node): i for i, node in enumerate(tree_to_list(block.node, []))}
+    object_index = {id(block): -1}
+    entries = []
+    for obj in tree_to_list(block, [])[1:]:
+        object_index[id(obj)] = len(entries)
+        attributes = {name: value for name, value in obj.__dict__.items()
+                      if name not in LINK_ATTRIBUTES}
+        attributes["x"] -= block.x
+        attributes["y"] -= block.y
+        previous = object_index[id(obj.previous)] if obj.previous else None
+        entries.append((type(obj), node_index[id(obj.node)], object_index[id(obj.parent)],
+                        previous, attributes))
+    return template_check(block), block.height, entries
+
+def template_check(block):
+    return getattr(block.node, "tag", None), block.node.subtree_text
+
+def apply_template(block, template):
+    _, height, entries = template
+    nodes = tree_to_list(block.node, [])
+    objects = []
+    emoji = set()
+    for cls, node, parent, previous, attributes in entries:
+        if attributes.get("emoji"):
+            emoji.add(attributes["emoji"])
+        obj = cls.__new__(cls)
+        obj.__dict__.update(attributes)
+        obj.x += block.x
+        obj.y += block.y
+        obj.node = nodes[node]
+        obj.parent = block if parent == -1 else objects[parent]
+        obj.previous = objects[previous] if previous is not None else None
+        obj.children = []
+        obj.parent.children.append(obj)
+        objects.append(obj)
+    block.height = height
+    # Like TextLayout.layout, so the atlas decodes them before paint needs them
+    for name in emoji:
+        get_atlas(EMOJI_SIZE).preload(name)
 
 def paint_tree(layout_object, display_list):
     display_list.extend(layout_object.paint())
@@ -47,6 +134,9 @@ class DocumentLayout:
         self.x = HSTEP
         self.y = VSTEP
 
+        if not hasattr(self.node, "layout_hash"):
+            hash_tree(self.node)
+
         child = BlockLayout(self.node, self, None)
         self.children.append(child)
         child.layout()
@@ -102,6 +192,7 @@ class TextLayout:
         self.width = None
         self.height = None
         self.font = None
+        self.emoji = None
 
     def layout(self):
         weight = self.node.style["font-weight"]
@@ -125,14 +216,74 @@ class TextLayout:
 
         self.height = self.font.metrics("linespace")
 
+        self.emoji = emoji_name(self.word)
+        if self.emoji:
+            get_atlas(EMOJI_SIZE).preload(self.emoji)
+
     def paint(self):
         color = self.node.style["color"]
-        if emoji.is_emoji(self.word):
-            return [DrawEmoji(self.x, self.y, self.word)]
+        if self.emoji:
+            return [DrawEmoji(self.x, self.y, self.emoji)]
         else:
             return [DrawText(self.x, self.y, self.word, self.font, color)]
 
 
+class SourceLayout:
+    # NOTE: Lays out view-source: text as unwrapped monospace lines. Instead
+    # of a layout object per word, it keeps a line index: the offset and line
+    # count of every block of SOURCE_BLOCK_LINES lines, each painted as one
+    # command, so only the blocks in view ever reach the canvas
+    def __init__(self, node, parent, previous):
+        self.node = node
+        self.parent = parent
+        self.previous = previous
+        self.children = []
+        self.blocks = []
+
+        self.x = None
+        self.y = None
+        self.width = None
+        self.height = None
+        self.font = None
+
+    def layout(self):
+        self.x = self.parent.x
+        self.y = self.parent.y
+        self.width = self.parent.width
+
+        weight = self.node.style["font-weight"]
+        style = self.node.style["font-style"]
+        if style == "normal": style = "roman"
+        size = int(float(self.node.style["font-size"][:-2]) * .75)
+        self.font = get_font("Courier", size, weight, style)
+
+        # Every block is (start offset, end offset, line count)
+        source = self.node.text
+        self.blocks = []
+        for match in SOURCE_BLOCK.finditer(source):
+            start, end = match.span()
+            lines = source.count("\n", start, end)
+            if source.endswith("\n", start, end):
+                end -= 1
+            else:
+                lines += 1
+            self.blocks.append((start, end, lines))
+
+        lines = sum([block[2] for block in self.blocks])
+        self.height = lines * self.font.metrics("linespace")
+
+    def paint(self):
+        cmds = []
+        color = self.node.style["color"]
+        linespace = self.font.metrics("linespace")
+        y = self.y
+        for start, end, lines in self.blocks:
+            cmds.append(DrawLines(self.x, y, self.node.text, start, end,
+                                  lines, self.font, color))
+            y += lines * linespace
+        return cmds
+
+
 class BlockLayout:
     def __init__(self, node, parent, previous):
         self.node = node
@@ -162,6 +313,8 @@ class BlockLayout:
         if isinstance(self.node, Text):
             return "inline"
         elif self.node.children:
+            if isinstance(self.node.children[0], SourceText):
+                return "source"
             if any(isinstance(child, Element) and \
                   child.style.get("display", "inline") == "block"
                   for child in self.node.children):
@@ -180,6 +333,13 @@ class BlockLayout:
         else:
             self.y = self.parent.y
 
+        key = self.cache_key()
+        if key:
+            template = layout_cache.get(key)
+            if template and template[0] == template_check(self):
+                apply_template(self, template)
+                return
+
         mode = self.layout_mode()
         if mode == "block":
             previous = None
@@ -189,6 +349,8 @@ class BlockLayout:
                 next = BlockLayout(child, self, previous)
                 self.children.append(next)
                 previous = next
+        elif mode == "source":
+            self.children.append(SourceLayout(self.node.children[0], self, None))
         else:
             self.new_line()
             self.recurse(self.node)
@@ -197,6 +359,18 @@ class BlockLayout:
             child.layout()
 
         self.compute_height()
+        if key:
+            if key in layout_seen:
+                layout_cache[key] = make_template(self)
+            else:
+                layout_seen[key] = True
+
+    def cache_key(self):
+        # Only mid-sized subtrees, hashed by DocumentLayout. Position doesn't
+        # matter, since templates are relative to the block
+        size = getattr(self.node, "subtree_size", 0)
+        if not LAYOUT_CACHE_MIN_NODES <= size <= LAYOUT_CACHE_MAX_NODES: return None
+        return (self.node.layout_hash, size, self.width)
 
     def word(self, node, word):
         weight = node.style["font-weight"]
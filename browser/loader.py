@@ -0,0 +1,177 @@
+import threading
+
+from browser.css_parser import CSSParser, cascade_priority, style, load_style_sheet
+from browser.html_parser import Element, HTMLParser, tree_to_list, source_tree
+from browser.trace import tracer
+from browser.url import pipeline
+from browser.constants import HTTP_PIPELINING
+
+DEFAULT_STYLE_SHEET_PATH = "data/browser.css"
+DEFAULT_STYLE_SHEET = None
+
+def default_style_sheet():
+    global DEFAULT_STYLE_SHEET
+    if DEFAULT_STYLE_SHEET is None:
+        DEFAULT_STYLE_SHEET = load_style_sheet(DEFAULT_STYLE_SHEET_PATH)
+    return DEFAULT_STYLE_SHEET
+
+LOADER_POLL_MS = 16
+
+
+class LoadCancelled(Exception):
+    pass
+
+
+class LoadTask:
+    def __init__(self, tab, url, entry=None):
+        self.tab = tab
+        self.url = url
+        # History entry being revisited, None for a new navigation
+        self.entry = entry
+        self.nodes = None
+        self.error = None
+        # Body fetched before the task started, for about: pages
+        self.body = None
+        self.cancelled = threading.Event()
+        self.finished = threading.Event()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def check(self):
+        if self.cancelled.is_set():
+            raise LoadCancelled()
+
+# NOTE: Everything up to and including style runs off the Tk thread. Layout
+# measures text with Tk fonts, so it stays on the Tk thread in `Tab.commit`.
+def fetch_document(task):
+    with tracer.span("fetch_document") as span:
+        if tracer.enabled:
+            span.set(url=str(task.url))
+        return _fetch_document(task)
+
+def is_stylesheet_link(node):
+    return isinstance(node, Element) and node.tag == "link" and \
+        node.attributes.get("rel") == "stylesheet" and "href" in node.attributes
+
+def _fetch_document(task):
+    url = task.url
+    body = task.body if task.body is not None else url.request()
+    task.check()
+
+    if not body:
+        return None
+
+    with tracer.span("HTMLParser.parse", bytes=len(body)) as span:
+        if url.view_source:
+            nodes = source_tree(body)
+        else:
+            nodes = HTMLParser(body).parse()
+        node_list = tree_to_list(nodes, [])
+        span.set(nodes=len(node_list))
+    task.check()
+
+    rules = default_style_sheet().copy()
+
+    with tracer.span("stylesheets") as span:
+        links = [node for node in node_list if is_stylesheet_link(node)]
+        # Same-origin style sheets share one pipelined connection when enabled
+        prefetched = {}
+        if HTTP_PIPELINING and len(links) > 1:
+            style_urls = [url.resolve(node.attributes["href"]) for node in links]
+            prefetched = {links[i]: body for i, body in pipeline(style_urls).items()}
+            task.check()
+
+        for node in node_list:
+            if not isinstance(node, Element): continue
+            if is_stylesheet_link(node):
+                link = node.attributes["href"]
+                style_url = url.resolve(link)
+                if node in prefetched:
+                    body = prefetched[node]
+                else:
+                    try: # Ingores style sheets that fail to download
+                        body = style_url.request()
+                    except Exception as e:
+                        print(f"Error downloading {style_url}: {e}")
+                        continue
+                task.check()
+                with tracer.span("CSSParser.parse") as parse_span:
+                    if tracer.enabled:
+                        parse_span.set(url=str(style_url))
+                    rules.extend(CSSParser(body).parse())
+            elif node.tag == "style" and node.children:
+                with tracer.span("CSSParser.parse"):
+                    rules.extend(CSSParser(node.children[0].text).parse())
+        span.set(rules=len(rules))
+
+    with tracer.span("style", nodes=len(node_list), rules=len(rules)):
+        style(nodes, sorted(rules, key=cascade_priority))
+    return nodes
+
+
+def run_task(task):
+    try:
+        task.nodes = fetch_document(task)
+    except LoadCancelled:
+        pass
+    except Exception as e:
+        task.error = e
+    task.finished.set()
+
+def start_task(task):
+    threading.Thread(target=run_task, args=(task,), daemon=True).start()
+    return task
+
+
+class PageLoader:
+    # NOTE: Each load runs on its own worker thread. The Tk thread polls the
+    # loads in flight with `after` and hands finished ones to `on_loaded`.
+    # Starting a new load for a tab cancels the one in flight.
+    def __init__(self, window, on_loaded):
+        self.window = window
+        self.on_loaded = on_loaded
+        self.tasks = []
+        self.in_flight = 0
+
+    def load(self, tab, url, entry=None):
+        task = LoadTask(tab, url, entry)
+        # about: pages report on tabs and caches the Tk thread is changing,
+        # so they're generated here, before the worker starts
+        if getattr(url, "scheme", None) == "about":
+            task.body = url.request()
+        return self.adopt(tab, start_task(task))
+
+    # Tracks a task that may have been started before the tab existed
+    def adopt(self, tab, task):
+        if tab.loading:
+            tab.loading.cancel()
+        task.tab = tab
+        tab.loading = task
+
+        self.tasks.append(task)
+        self.in_flight = len(self.tasks)
+        if self.in_flight == 1:
+            self.window.after(LOADER_POLL_MS, self.poll)
+        return task
+
+    def poll(self):
+        finished, running = [], []
+        for task in self.tasks:
+            if task.finished.is_set():
+                finished.append(task)
+            else:
+                running.append(task)
+        self.tasks = running
+        self.in_flight = len(running)
+
+        for task in finished:
+            if task.cancelled.is_set() or task.tab.loading is not task:
+                continue
+            task.tab.loading = None
+            if task.error:
+                print(f"Error loading {task.url}: {task.error}")
+            self.on_loaded(task)
+
+        if self.in_flight:
+            self.window.after(LOADER_POLL_MS, self.poll)
@@ -0,0 +1,137 @@
+import os
+import sys
+import html
+import tracemalloc
+
+from browser.html_parser import tree_to_list
+from browser.emoji_atlas import atlases
+from browser.cache_manager import registry
+
+TRACEMALLOC_TOP = 15
+
+# NOTE: Sizes are estimates: an object's own size plus its attribute dict
+# and the strings, dicts and lists it holds directly. Shared objects are
+# counted once per holder. Nothing here calls into Tk, but reports walk
+# tabs and caches the Tk thread changes, so build them on the Tk thread.
+def object_size(obj):
+    size = sys.getsizeof(obj)
+    attributes = getattr(obj, "__dict__", None)
+    if attributes is None:
+        return size
+    size += sys.getsizeof(attributes)
+    for value in attributes.values():
+        if isinstance(value, (str, bytes, list, dict, tuple)):
+            size += sys.getsizeof(value)
+    return size
+
+def measure_objects(objects):
+    return {"count": len(objects), "bytes": sum([object_size(obj) for obj in objects])}
+
+def measure_page(nodes, document, display_list):
+    node_list = tree_to_list(nodes, []) if nodes else []
+    report = {"dom": measure_objects(node_list)}
+    # Style dicts hang off the DOM nodes but are big enough to list apart
+    report["styles"] = measure_objects(
+        [node.style for node in node_list if hasattr(node, "style")])
+    report["layout"] = measure_objects(tree_to_list(document, []) if document else [])
+    report["display_list"] = measure_objects(display_list)
+    return report
+
+def measure_tab(tab):
+    report = {"url": str(tab.url) if hasattr(tab, "url") else None}
+    report.update(measure_page(tab.nodes, tab.document, tab.display_list))
+
+    history = {"count": len(tab.history.cache), "bytes": 0}
+    for page in tab.history.cache.values():
+        for part in measure_page(page.nodes, page.document, page.display_list).values():
+            history["bytes"] += part["bytes"]
+    report["history_cache"] = history
+    report["snapshot"] = {"bytes": len(tab.snapshot.dom)
+                          if tab.snapshot and tab.snapshot.dom else 0}
+    return report
+
+def measure_caches():
+    report = registry.stats()
+
+    # The atlas sheets aren't cache entries, they back every sprite decode
+    sheets = [atlas.sheet for atlas in list(atlases.values()) if atlas.sheet is not None]
+    report["emoji_atlas_sheets"] = {
+        "count": len(sheets),
+        "bytes": sum(sheet.width * sheet.height * 4 for sheet in sheets),
+    }
+    return report
+
+def memory_report(browser):
+    report = {
+        "tabs": [measure_tab(tab) for tab in list(browser.tabs)],
+        "caches": measure_caches(),
+    }
+    if memory_tracker.enabled:
+        report["tracemalloc"] = memory_tracker.diffs
+    return report
+
+
+class MemoryTracker:
+    # NOTE: Optional, since tracemalloc slows everything down. When enabled,
+    # a snapshot is taken after every navigation and diffed with the last one.
+    def __init__(self):
+        self.enabled = False
+        self.last = None
+        self.diffs = []
+
+    def enable(self):
+        tracemalloc.start()
+        self.enabled = True
+        self.last = tracemalloc.take_snapshot()
+
+    def navigated(self, url):
+        if not self.enabled: return
+        snapshot = tracemalloc.take_snapshot()
+        stats = snapshot.compare_to(self.last, "lineno")[:TRACEMALLOC_TOP]
+        self.last = snapshot
+        self.diffs.append({"url": str(url), "top": [str(stat) for stat in stats]})
+
+memory_tracker = MemoryTracker()
+
+# Setting BROWSER_TRACEMALLOC=1 diffs allocations across navigations
+if os.environ.get("BROWSER_TRACEMALLOC"):
+    memory_tracker.enable()
+
+def format_bytes(size):
+    for unit in ["B", "KB", "MB"]:
+        if size < 1024:
+            return f"{size:.1f} {unit}" if unit != "B" else f"{size} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+def memory_page(browser):
+    report = memory_report(browser)
+    out = ["<html><body><h1>about:memory</h1>"]
+
+    total = 0
+    for i, tab in enumerate(report["tabs"]):
+        out.append(f"<h2>Tab {i + 1}: {html.escape(str(tab['url']))}</h2>")
+        for name, part in tab.items():
+            if name == "url": continue
+            total += part["bytes"]
+            count = f"{part['count']} items, " if "count" in part else ""
+            out.append(f"<p><b>{name}</b>: {count}{format_bytes(part['bytes'])}</p>")
+
+    out.append("<h2>Caches</h2>")
+    for name, part in report["caches"].items():
+        total += part["bytes"]
+        hits = ""
+        if "hits" in part:
+            hits = (f", {part['hits']} hits, {part['misses']} misses, "
+                    f"{part['evictions']} evictions")
+        out.append(f"<p><b>{name}</b>: {part['count']} items, "
+                   f"{format_bytes(part['bytes'])}{hits}</p>")
+    out.append(f"<h2>Total: {format_bytes(total)}</h2>")
+
+    for diff in report.get("tracemalloc", []):
+        out.append(f"<h2>Allocated by {html.escape(diff['url'])}</h2>")
+        for line in diff["top"]:
+            out.append(f"<p>{html.escape(line)}</p>")
+
+    out.append("</body></html>")
+    return "\n".join(out)
@@ -0,0 +1,62 @@
+from bisect import bisect_right, insort
+from browser.constants import PAINT_MARGIN, EVICT_MARGIN, PAINTER_MAX_ITEMS
+
+CONTENT_TAG = "content"
+
+
+class RetainedPainter:
+    # NOTE: Canvas items are created once per display list entry and then
+    # kept around. Scrolling moves every retained item with a single
+    # `canvas.move` instead of deleting and recreating them each frame.
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.version = None
+        self.display_list = None
+        # Key: index into the display list, value: canvas item id
+        self.items = {}
+        self.order = []
+        self.scroll = 0
+
+    def reset(self, display_list, version, scroll):
+        self.canvas.delete(CONTENT_TAG)
+        self.version = version
+        self.display_list = display_list
+        self.items = {}
+        self.order = []
+        self.scroll = scroll
+
+    def paint(self, display_list, display_index, version, scroll, width, height):
+        if version != self.version:
+            self.reset(display_list, version, scroll)
+        elif scroll != self.scroll:
+            self.canvas.move(CONTENT_TAG, 0, self.scroll - scroll)
+            self.scroll = scroll
+
+        margin = PAINT_MARGIN * height
+        for i in display_index.query_indices(scroll - margin, scroll + height + margin):
+            if i in self.items: continue
+            item = display_list[i].execute(scroll, self.canvas, CONTENT_TAG)
+            # Items created later end up on top, so restore paint order by
+            # placing the new item below the next command in the list
+            pos = bisect_right(self.order, i)
+            if pos < len(self.order):
+                self.canvas.tag_lower(item, self.items[self.order[pos]])
+            insort(self.order, i)
+            self.items[i] = item
+
+        if len(self.items) > PAINTER_MAX_ITEMS:
+            self.evict(scroll, height)
+
+    def evict(self, scroll, height):
+        top = scroll - EVICT_MARGIN * height
+        bottom = scroll + height + EVICT_MARGIN * height
+
+        evicted = []
+        for i in self.order:
+            cmd = self.display_list[i]
+            if cmd.bottom < top or cmd.top > bottom:
+                evicted.append(self.items.pop(i))
+        if not evicted: return
+
+        self.canvas.delete(*evicted)
+        self.order = sorted(self.items)
@@ -0,0 +1,153 @@
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageDraw, ImageFont, ImageTk
+
+from browser.constants import TILE_SIZE, RASTER_WORKERS, TILE_CACHE_BUDGET
+from browser.painter import CONTENT_TAG
+from browser.cache_manager import ManagedCache
+
+TILE_POLL_MS = 10
+
+# Key: Tk font name
+raster_font_cache = ManagedCache("raster_fonts")
+
+def get_raster_font(font):
+    # NOTE: Must run on the Tk thread, since it asks Tk about the font
+    raster_font = raster_font_cache.get(font.name)
+    if raster_font is None:
+        actual = font.actual()
+        size = actual["size"]
+        pixels = -size if size < 0 else round(size * 4 / 3)
+
+        suffix = ""
+        if actual["weight"] == "bold":
+            suffix += "Bold"
+        if actual["slant"] == "italic":
+            suffix += "Oblique"
+        suffix = "-" + suffix if suffix else ""
+
+        candidates = [actual["family"].replace(" ", "") + suffix + ".ttf",
+                      "DejaVuSans" + suffix + ".ttf"]
+        raster_font = None
+        for candidate in candidates:
+            try:
+                raster_font = ImageFont.truetype(candidate, pixels)
+                break
+            except OSError:
+                continue
+        if raster_font is None:
+            raster_font = ImageFont.load_default(pixels)
+        raster_font_cache[font.name] = raster_font
+    return raster_font
+
+def rasterize_tile(cmds, fonts, tx, ty):
+    image = Image.new("RGB", (TILE_SIZE, TILE_SIZE), "white")
+    draw = ImageDraw.Draw(image)
+    for cmd in cmds:
+        try:
+            cmd.rasterize(image, draw, fonts, -tx * TILE_SIZE, -ty * TILE_SIZE)
+        except ValueError: # Colors or geometry PIL can't draw
+            continue
+    return image
+
+
+def tile_size(key, image):
+    return image.width * image.height * len(image.getbands())
+
+
+class TilePainter:
+    # NOTE: Same interface as RetainedPainter, but the display list is
+    # rasterized into tiles by worker threads. A frame only places cached
+    # tile images on the canvas, so its cost doesn't depend on how much
+    # content is on screen.
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.executor = ThreadPoolExecutor(RASTER_WORKERS)
+        # Key: (display list version, tile x, tile y)
+        self.cache = ManagedCache("tiles", size=tile_size, max_bytes=TILE_CACHE_BUDGET)
+        self.version = None
+        self.display_index = None
+        self.scroll = 0
+        # Key: (tile x, tile y), value: (canvas item, PhotoImage)
+        self.items = {}
+        # Key: (display list version, tile x, tile y)
+        self.pending = {}
+        self.wanted = set()
+        self.polling = False
+
+    def paint(self, display_list, display_index, version, scroll, width, height):
+        if version != self.version:
+            self.canvas.delete(CONTENT_TAG)
+            self.items = {}
+            for future in self.pending.values():
+                future.cancel()
+            self.pending = {}
+            self.version = version
+            self.display_index = display_index
+            self.scroll = scroll
+        elif scroll != self.scroll:
+            self.canvas.move(CONTENT_TAG, 0, self.scroll - scroll)
+            self.scroll = scroll
+
+        # Also rasterize one row of tiles above and below the viewport
+        first_row = int(scroll // TILE_SIZE) - 1
+        last_row = int((scroll + height) // TILE_SIZE) + 1
+        columns = int(max(width - 1, 0) // TILE_SIZE) + 1
+        self.wanted = {(tx, ty) for ty in range(max(first_row, 0), last_row + 1)
+                       for tx in range(columns)}
+
+        for tile in list(self.items):
+            if tile not in self.wanted:
+                item, _ = self.items.pop(tile)
+                self.canvas.delete(item)
+
+        for tx, ty in sorted(self.wanted, key=lambda tile: tile[1]):
+            if (tx, ty) in self.items: continue
+            key = (version, tx, ty)
+            image = self.cache.get(key)
+            if image is not None:
+                self.show(tx, ty, image)
+            elif key not in self.pending:
+                self.pending[key] = self.submit(tx, ty)
+
+        if self.pending and not self.polling:
+            self.polling = True
+            self.canvas.after(TILE_POLL_MS, self.poll)
+
+    def submit(self, tx, ty):
+        cmds = self.display_index.query(ty * TILE_SIZE, (ty + 1) * TILE_SIZE)
+        # Any command drawing text (DrawText, DrawLines) carries a font
+        fonts = {cmd.font.name: get_raster_font(cmd.font)
+                 for cmd in cmds if getattr(cmd, "font", None) is not None}
+        return self.executor.submit(rasterize_tile, cmds, fonts, tx, ty)
+
+    def poll(self):
+        for key, future in list(self.pending.items()):
+            if not future.done(): continue
+            del self.pending[key]
+            version, tx, ty = key
+            if future.cancelled() or version != self.version: continue
+
+            try:
+                image = future.result()
+            except Exception as e: # A broken tile must not stop the painter
+                print(f"Error rasterizing tile {(tx, ty)}: {e!r}")
+                continue
+            self.cache.put(key, image)
+            if (tx, ty) in self.wanted and (tx, ty) not in self.items:
+                self.show(tx, ty, image)
+
+        if self.pending:
+            self.canvas.after(TILE_POLL_MS, self.poll)
+        else:
+            self.polling = False
+
+    def show(self, tx, ty, image):
+        photo = ImageTk.PhotoImage(image)
+        item = self.canvas.create_image(
+            tx * TILE_SIZE, ty * TILE_SIZE - self.scroll,
+            anchor="nw",
+            image=photo,
+            tags=CONTENT_TAG)
+        # Tiles may arrive after the scrollbar was drawn
+        self.canvas.tag_lower(item)
+        self.items[(tx, ty)] = (item, photo)
@@ -0,0 +1,121 @@
+import time
+import errno
+import socket
+import selectors
+
+from browser.constants import DNS_TTL, CONNECT_TIMEOUT, CONNECT_ATTEMPT_DELAY
+from browser.cache_manager import ManagedCache
+from browser.trace import tracer
+
+# connect() on a non-blocking socket reports these while the handshake runs
+CONNECT_PENDING = {0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY,
+                   getattr(errno, "WSAEWOULDBLOCK", 0)}
+
+def system_lookup(host, port):
+    infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM, proto=socket.IPPROTO_TCP)
+    return [(family, sockaddr) for family, _, _, _, sockaddr in infos]
+
+
+class Resolver:
+    # NOTE: Caches lookups for DNS_TTL seconds. getaddrinfo doesn't expose
+    # record TTLs, so every answer gets the same one. `lookup` can be any
+    # function returning [(family, sockaddr)], e.g. a stand-in in benchmarks.
+    def __init__(self, lookup=system_lookup, ttl=DNS_TTL, name="dns"):
+        self.lookup = lookup
+        self.lookups = 0
+        # Key: (host, port), value: [(family, sockaddr)]
+        self.cache = ManagedCache(name, ttl=ttl)
+
+    def resolve(self, host, port):
+        addresses = self.cache.get((host, port))
+        if addresses is None:
+            with tracer.span("DNS lookup", host=host):
+                self.lookups += 1
+                addresses = self.lookup(host, port)
+            self.cache[(host, port)] = addresses
+        return addresses
+
+resolver = Resolver()
+
+def interleave(addresses):
+    # Alternates address families, starting with the first one resolved,
+    # so one unreachable family can't hold up every attempt
+    families = {}
+    for family, sockaddr in addresses:
+        families.setdefault(family, []).append((family, sockaddr))
+
+    ordered = []
+    groups = list(families.values())
+    while any(groups):
+        for group in groups:
+            if group:
+                ordered.append(group.pop(0))
+    return ordered
+
+# NOTE: Happy eyeballs: connection attempts start CONNECT_ATTEMPT_DELAY
+# apart (or as soon as the previous one fails) and race each other, the
+# first handshake to finish wins and the others are closed. Everything
+# gives up after CONNECT_TIMEOUT, instead of the OS default of minutes.
+def open_connection(host, port, timeout=CONNECT_TIMEOUT, delay=CONNECT_ATTEMPT_DELAY,
+                    resolver=resolver):
+    addresses = interleave(resolver.resolve(host, port))
+    if not addresses:
+        raise ConnectionError(f"No addresses for {host}")
+
+    selector = selectors.DefaultSelector()
+    # Key: socket, value: sockaddr
+    pending = {}
+    errors = []
+    timed_out = False
+    deadline = time.monotonic() + timeout
+    next_attempt = time.monotonic()
+
+    try:
+        while addresses or pending:
+            now = time.monotonic()
+            if now >= deadline:
+                timed_out = True
+                break
+
+            if addresses and (now >= next_attempt or not pending):
+                family, sockaddr = addresses.pop(0)
+                # e.g. an IPv6 address on a host without IPv6 support
+                try:
+                    s = socket.socket(family, socket.SOCK_STREAM, socket.IPPROTO_TCP)
+                except OSError as e:
+                    errors.append(e)
+                    continue
+                s.setblocking(False)
+                error = s.connect_ex(sockaddr)
+                if error not in CONNECT_PENDING:
+                    errors.append(OSError(error, f"{sockaddr}: {errno.errorcode.get(error, error)}"))
+                    s.close()
+                    continue
+                selector.register(s, selectors.EVENT_WRITE)
+                pending[s] = sockaddr
+                next_attempt = now + delay
+
+            wait = deadline - now
+            if addresses:
+                wait = min(wait, max(next_attempt - now, 0))
+            for key, _ in selector.select(wait):
+                s = key.fileobj
+                selector.unregister(s)
+                sockaddr = pending.pop(s)
+                error = s.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if error:
+                    errors.append(OSError(error, f"{sockaddr}: {errno.errorcode.get(error, error)}"))
+                    s.close()
+                    next_attempt = time.monotonic()
+                    continue
+                s.setblocking(True)
+                tracer.count("connections")
+                return s
+    finally:
+        selector.close()
+        for s in pending:
+            s.close()
+
+    if timed_out:
+        raise TimeoutError(f"Connecting to {host}:{port} timed out after {timeout}s")
+    raise ConnectionError(f"Could not connect to {host}:{port}: {errors[-1]}")
@@ -0,0 +1,96 @@
+import time
+from browser.constants import FRAME_INTERVAL, SMOOTH_SCROLL_FRAMES
+
+
+class FrameScheduler:
+    # NOTE: Input handlers only record what happened. The pending work is
+    # rendered at most once per frame from a Tk `after` callback, so a burst
+    # of wheel events turns into a single scroll and redraw.
+    def __init__(self, window, render, smooth_scroll=False):
+        self.window = window
+        self.render = render
+        self.smooth_scroll = smooth_scroll
+
+        self.scheduled = False
+        self.deadline = 0
+        self.last_frame = 0
+
+        self.scroll_delta = 0
+        self.scroll_frames = 0
+        self.size = None
+        self.clicks = []
+
+        self.stats = {
+            "events": 0,
+            "frames": 0,
+            "late_frames": 0,
+            "dropped_frames": 0,
+            "worst_frame_ms": 0.0,
+        }
+
+    def scroll(self, delta):
+        self.scroll_delta += delta
+        self.scroll_frames = SMOOTH_SCROLL_FRAMES
+        self.request_frame()
+
+    def resize(self, width, height):
+        self.size = (width, height)
+        self.request_frame()
+
+    def click(self, x, y):
+        self.clicks.append((x, y))
+        self.request_frame()
+
+    def request_frame(self):
+        self.stats["events"] += 1
+        if self.scheduled: return
+        self.scheduled = True
+
+        now = time.perf_counter()
+        self.deadline = max(now, self.last_frame + FRAME_INTERVAL)
+        delay = int((self.deadline - now) * 1000)
+        self.window.after(delay, self.run_frame)
+
+    def run_frame(self):
+        self.scheduled = False
+        start = time.perf_counter()
+        self.last_frame = start
+
+        if self.smooth_scroll and self.scroll_frames > 1:
+            scroll = round(self.scroll_delta / self.scroll_frames)
+            self.scroll_frames -= 1
+        else:
+            scroll = self.scroll_delta
+            self.scroll_frames = 0
+        self.scroll_delta -= scroll
+
+        size, clicks = self.size, self.clicks
+        self.size, self.clicks = None, []
+
+        self.render(scroll, size, clicks)
+
+        if self.scroll_delta:
+            self.scheduled = True
+            self.deadline = start + FRAME_INTERVAL
+            self.window.after(int(FRAME_INTERVAL * 1000), self.run_frame)
+
+        self.record_frame(start, time.perf_counter())
+
+    def record_frame(self, start, end):
+        self.stats["frames"] += 1
+        frame_ms = (end - start) * 1000
+        self.stats["worst_frame_ms"] = max(self.stats["worst_frame_ms"], frame_ms)
+
+        # A frame is late when it finishes after the frame it was scheduled
+        # for; every further frame interval it overran counts as dropped
+        overrun = end - self.deadline
+        if overrun > FRAME_INTERVAL:
+            self.stats["late_frames"] += 1
+            self.stats["dropped_frames"] += int(overrun // FRAME_INTERVAL)
+
+    def report(self):
+        coalesced = self.stats["events"] - self.stats["frames"]
+        return ", ".join(
+            [f"{key}={value:.1f}" if isinstance(value, float) else f"{key}={value}"
+             for key, value in self.stats.items()] +
+            [f"coalesced_events={max(coalesced, 0)}"])
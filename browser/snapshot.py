@@ -0,0 +1,29 @@
+import pickle
+import zlib
+
+
+class TabSnapshot:
+    def __init__(self, url, scroll, dom):
+        self.url = url
+        self.scroll = scroll
+        # Compressed pickle of the styled DOM, or None if it couldn't be saved
+        self.dom = dom
+
+    def __repr__(self) -> str:
+        size = len(self.dom) if self.dom else 0
+        return f"TabSnapshot(url={self.url} scroll={self.scroll} dom={size} bytes)"
+
+# NOTE: The layout tree and display list hold Tk fonts and can't be pickled,
+# but the styled DOM can. Restoring it only needs layout and paint, with no
+# network, parsing or style.
+def take_snapshot(tab):
+    dom = None
+    if tab.nodes:
+        try:
+            dom = zlib.compress(pickle.dumps(tab.nodes, pickle.HIGHEST_PROTOCOL))
+        except RecursionError: # Very deep DOMs get refetched instead
+            dom = None
+    return TabSnapshot(tab.url, tab.scroll, dom)
+
+def restore_nodes(snapshot):
+    return pickle.loads(zlib.decompress(snapshot.dom))
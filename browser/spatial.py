@@ -0,0 +1,59 @@
+from browser.constants import SPATIAL_BUCKET_HEIGHT
+
+
+def display_bounds(cmd):
+    return cmd.top, cmd.bottom
+
+def layout_bounds(obj):
+    return obj.y, obj.y + obj.height
+
+class SpatialIndex:
+    # NOTE: Items are bucketed by y. An item is stored in every bucket its
+    # vertical extent touches, and each bucket holds indices in the original
+    # (paint / tree) order, so queries can return items in that same order.
+    def __init__(self, items, bounds):
+        self.items = items
+        self.bounds = bounds
+        self.buckets = {}
+
+        for i, item in enumerate(items):
+            top, bottom = bounds(item)
+            first = int(top // SPATIAL_BUCKET_HEIGHT)
+            last = int(bottom // SPATIAL_BUCKET_HEIGHT)
+            for bucket in range(first, last + 1):
+                if bucket not in self.buckets:
+                    self.buckets[bucket] = []
+                self.buckets[bucket].append(i)
+
+    def query_indices(self, top, bottom):
+        first = int(top // SPATIAL_BUCKET_HEIGHT)
+        last = int(bottom // SPATIAL_BUCKET_HEIGHT)
+
+        if first == last:
+            candidates = self.buckets.get(first, [])
+        else:
+            candidates = set()
+            for bucket in range(first, last + 1):
+                candidates.update(self.buckets.get(bucket, []))
+            candidates = sorted(candidates)
+
+        indices = []
+        for i in candidates:
+            item_top, item_bottom = self.bounds(self.items[i])
+            if item_top > bottom: continue
+            if item_bottom < top: continue
+            indices.append(i)
+        return indices
+
+    def query(self, top, bottom):
+        return [self.items[i] for i in self.query_indices(top, bottom)]
+
+    # Returns the last item (in original order) containing the point
+    def hit_test(self, x, y):
+        bucket = self.buckets.get(int(y // SPATIAL_BUCKET_HEIGHT), [])
+        for i in reversed(bucket):
+            obj = self.items[i]
+            if obj.x <= x < obj.x + obj.width and \
+                    obj.y <= y < obj.y + obj.height:
+                return obj
+        return None
@@ -0,0 +1,49 @@
+import queue
+import threading
+import time
+
+from browser.constants import SPECULATION_WORKERS, SPECULATION_TTL
+
+
+class Speculator:
+    # NOTE: Best-effort warm-up for likely navigations. A few worker threads
+    # open connections (and optionally fetch the body into the HTTP cache)
+    # for hinted links, newest hint first. Work is skipped while a page load
+    # is in flight, and `cancel` drops everything queued so far.
+    def __init__(self, is_busy):
+        self.is_busy = is_busy
+        self.jobs = queue.LifoQueue()
+        self.generation = 0
+        # Key: (url, prefetch), value: time of the last hint
+        self.hinted = {}
+
+        for _ in range(SPECULATION_WORKERS):
+            threading.Thread(target=self.run, daemon=True).start()
+
+    def hint(self, url, prefetch=False):
+        if url.is_malformed or url.scheme not in ["http", "https"]:
+            return
+        key = (str(url), prefetch)
+        now = time.monotonic()
+        if now - self.hinted.get(key, -SPECULATION_TTL) < SPECULATION_TTL:
+            return
+        self.hinted[key] = now
+        self.jobs.put((self.generation, url, prefetch))
+
+    def cancel(self):
+        self.generation += 1
+        self.hinted.clear()
+
+    def is_stale(self, generation):
+        return generation != self.generation or self.is_busy()
+
+    def run(self):
+        while True:
+            generation, url, prefetch = self.jobs.get()
+            if self.is_stale(generation): continue
+            try:
+                url.preconnect()
+                if prefetch and not self.is_stale(generation):
+                    url.request(prefetch=True)
+            except Exception: # Speculation failing must never affect browsing
+                continue
@@ -0,0 +1,94 @@
+import os
+import json
+import time
+import atexit
+import threading
+
+
+class NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        pass
+
+NULL_SPAN = NullSpan()
+
+
+class Span:
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter_ns()
+        self.tracer.events.append({
+            "name": self.name,
+            "ph": "X",
+            "ts": self.start / 1000,
+            "dur": (end - self.start) / 1000,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": self.args,
+        })
+        return False
+
+    def set(self, **args):
+        self.args.update(args)
+
+
+class Tracer:
+    # NOTE: Records Chrome `trace_event` JSON, which can be opened in
+    # chrome://tracing or Perfetto. Spans on the same thread nest by time.
+    # While disabled, `span` returns a shared no-op object and `count` returns
+    # right away, so instrumented code pays next to nothing.
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self.totals = {}
+
+    def enable(self):
+        self.events = []
+        self.totals = {}
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def span(self, name, **args):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, args)
+
+    # Adds to a running total that shows up as a counter track
+    def count(self, name, amount=1):
+        if not self.enabled: return
+        total = self.totals.get(name, 0) + amount
+        self.totals[name] = total
+        self.events.append({
+            "name": name,
+            "ph": "C",
+            "ts": time.perf_counter_ns() / 1000,
+            "pid": os.getpid(),
+            "args": {"value": total},
+        })
+
+    def export(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+        print(f"Wrote {len(self.events)} trace events to {path}")
+
+tracer = Tracer()
+
+# Setting BROWSER_TRACE=<path> traces the whole session and writes it on exit
+if os.environ.get("BROWSER_TRACE"):
+    tracer.enable()
+    atexit.register(tracer.export, os.environ["BROWSER_TRACE"])
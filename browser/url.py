@@ -1,14 +1,46 @@
-import socket
-import ssl
-import time
+import os
+import re
+import mmap
+import stat
+import codecs
 import gzip
 
-from browser.constants import MAX_REDIRECTS
+from browser.constants import MAX_REDIRECTS, PREFETCH_MAX_AGE, SOCKET_IDLE_TIMEOUT, \
+    PIPELINE_DEPTH
+from browser.trace import tracer
+from browser.cache_manager import ManagedCache
+from browser.resolver import open_connection
+
+# Rough size of an idle connection's kernel and SSL buffers
+SOCKET_SIZE_ESTIMATE = 16 * 1024
 
 # Key: (scheme, host, port)
-sockets = {}
+sockets = ManagedCache(
+    "sockets",
+    size=lambda address, s: SOCKET_SIZE_ESTIMATE,
+    ttl=SOCKET_IDLE_TIMEOUT,
+    on_evict=lambda address, s: s.close())
 # Key: "{scheme}://{host}{path}"
-cache = {}
+cache = ManagedCache("http")
+# Key: "{scheme}://{host}{path}". Prefetched bodies without their own max-age
+# live apart from the HTTP cache and serve only the next request for them
+prefetched = ManagedCache("prefetch", ttl=PREFETCH_MAX_AGE)
+# Key: name of an about: page, value: function returning its HTML. They read
+# live browser state, so they must be requested on the Tk thread
+about_pages = {}
+
+# Bytes searched for a byte order mark or <meta charset>
+SNIFF_BYTES = 1024
+# The UTF-32 LE mark starts with the UTF-16 LE one, so it's checked first
+BOMS = [
+    (codecs.BOM_UTF8, "utf-8"),
+    (codecs.BOM_UTF32_LE, "utf-32-le"),
+    (codecs.BOM_UTF32_BE, "utf-32-be"),
+    (codecs.BOM_UTF16_LE, "utf-16-le"),
+    (codecs.BOM_UTF16_BE, "utf-16-be"),
+]
+# Matches both <meta charset="..."> and the http-equiv Content-Type form
+META_CHARSET = re.compile(rb"""<meta[^>]*?charset\s*=\s*["']?\s*([\w.:-]+)""", re.IGNORECASE)
 
 class URL:
     def __init__(self, url):
@@ -45,8 +77,6 @@ class URL:
             self.path = url[len("file://"):]
             self.port = None
         elif url.startswith("data:"):
-            import re
-
             self.scheme = "data"
             self.data = url[url.find(",")+1:]
             match = re.search(r"([^,]+),", url)
@@ -54,30 +84,56 @@ class URL:
             self.host = ""
             self.path = ""
             self.port = None
+        elif url.startswith("about:"):
+            self.scheme = "about"
+            self.host = ""
+            self.path = url[len("about:"):]
+            self.port = None
         else:
             self.is_malformed = True
 
     def __str__(self):
+        if self.scheme == "about":
+            return "about:" + self.path
         port_part = ":" + str(self.port)
+        if self.port is None:
+            port_part = ""
         if self.scheme == "https" and self.port == 443:
             port_part = ""
         if self.scheme == "http" and self.port == 80:
             port_part = ""
         return self.scheme + "://" + self.host + port_part + self.path
 
-    def request(self, num_redirects = 0):
+    def request(self, num_redirects = 0, prefetch = False):
         if self.is_malformed:
             return None
 
-        if self.scheme == "data":
-            content = self.data
-        elif self.scheme == "file":
-            content = self._handle_file_request()
-        else:
-            content = self._handle_network_request(num_redirects)
+        with tracer.span("URL.request") as span:
+            if tracer.enabled:
+                span.set(url=str(self), prefetch=prefetch)
+            if self.scheme == "data":
+                content = self.data
+            elif self.scheme == "about":
+                page = about_pages.get(self.path)
+                content = page() if page else None
+            elif self.scheme == "file":
+                content = self._handle_file_request()
+            else:
+                content = self._handle_network_request(num_redirects, prefetch)
 
         return content
 
+    def preconnect(self):
+        if self.is_malformed or self.scheme not in ["http", "https"]:
+            return
+        address = (self.scheme, self.host, self.port)
+        if address in sockets:
+            return
+
+        s = self._connect()
+        if sockets.setdefault(address, s) is not s:
+            s.close()
+
     def resolve(self, url):
         if "://" in url: return URL(url) # Absolute
         if not url.startswith("/"):      # Relative to current path
@@ -98,47 +154,37 @@ class URL:
             return f"Error: No path provided"
 
         try:
-            with open(self.path, "r") as f:
-                content = f.read()
+            f = open(self.path, "rb")
         except FileNotFoundError:
-            content = f"Error: File not found: {self.path}"
+            return f"Error: File not found: {self.path}"
         except PermissionError:
-            content = f"Error: Permission denied: {self.path}"
+            return f"Error: Permission denied: {self.path}"
         except IsADirectoryError:
-            content = f"Error: Provided path is a directory: {self.path}"
-        except Exception as e:
-            raise e
+            return f"Error: Provided path is a directory: {self.path}"
 
-        return content
+        with f:
+            # Pipes and devices can't be mapped, so they're read whole
+            if not stat.S_ISREG(os.fstat(f.fileno()).st_mode):
+                return decode_body(f.read())
 
-    def _handle_network_request(self, num_redirects = 0):
-        # NOTE: Step 0: Check cache for request
-        cached_entry = cache.get(f"{self.scheme}://{self.host}{self.path}")
-        if cached_entry:
-            age = time.time() - cached_entry["timestamp"]
-            if age <= cached_entry["max-age"]:
-                return cached_entry["content"]
+            if os.fstat(f.fileno()).st_size == 0: return ""
+            # Decoded straight off the map, without a copy of the file as bytes
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return decode_body(data)
 
-        # NOTE: Step 1: Reuse or open a socket
-        global sockets
-        address = (self.scheme, self.host, self.port)
-        s = sockets.get(address)
+    def _connect(self):
+        s = open_connection(self.host, self.port)
 
-        if s is None or s.fileno() == -1:
-            s = socket.socket(
-                family=socket.AF_INET,
-                type=socket.SOCK_STREAM,
-                proto=socket.IPPROTO_TCP,
-            )
-            s.connect((self.host, self.port))
+        if self.scheme == "https":
+            import ssl
+            ctx = ssl.create_default_context()
+            s = ctx.wrap_socket(s, server_hostname=self.host)
+        return s
 
-            if self.scheme == "https":
-                ctx = ssl.create_default_context()
-                s = ctx.wrap_socket(s, server_hostname=self.host)
-
-            sockets[address] = s
+    def _cache_key(self):
+        return f"{self.scheme}://{self.host}{self.path}"
 
-        # NOTE: Step 2: Send GET request
+    def _build_request(self):
         headers = {
             "Host": self.host,
             "Connection": "keep-alive",
@@ -150,79 +196,89 @@ class URL:
         for key, val in headers.items():
             request += f"{key}: {val}\r\n"
         request += "\r\n"
+        return request.encode("utf-8")
 
-        s.send(request.encode("utf-8"))
+    def _handle_network_request(self, num_redirects = 0, prefetch = False):
+        # NOTE: Step 0: Check cache for request
+        cached_content = cached_response(self._cache_key(), prefetch)
+        if cached_content is not None:
+            tracer.count("HTTP cache hits")
+            return cached_content
+        tracer.count("HTTP cache misses")
 
-        # NOTE: Step 3: Parse statusline and response headers
-        response = s.makefile("rb")
-        statusline = response.readline().decode("utf-8")
-        version, status, explanation = statusline.split(" ", 2)
+        # NOTE: Step 1: Reuse or open a socket
+        # The socket is taken out of the pool while in use, so concurrent
+        # loads never share a connection, and returned once the body is read
+        address = (self.scheme, self.host, self.port)
+        s = sockets.pop(address, None)
+        reused = s is not None and s.fileno() != -1
 
-        response_headers = {}
-        while True:
-            line = response.readline()
-            if line == b"\r\n": break
-            header_line = line.decode("utf-8").strip()
-            header, value = header_line.split(":", 1)
-            response_headers[header.casefold()] = value.strip()
+        if not reused:
+            s = self._connect()
+
+        # NOTE: Step 2: Send GET request
+        # NOTE: Step 3: Read statusline, response headers and body
+        try:
+            s.send(self._build_request())
+            status, response_headers, content = read_response(s.makefile("rb"))
+        except (OSError, ConnectionError):
+            s.close()
+            # Pooled connections may have been closed by the server while idle
+            if reused:
+                return self._handle_network_request(num_redirects, prefetch)
+            raise ConnectionError(f"Connection closed by {self.host}")
+        except ValueError:
+            # A malformed response leaves the connection in an unknown state
+            s.close()
+            raise ConnectionError(f"Malformed response from {self.host}")
+
+        if keeps_alive(response_headers):
+            sockets[address] = s
+        else: # The body ends when the server closes the connection
+            s.close()
 
+        return self._finish_response(status, response_headers, content,
+                                     num_redirects, prefetch)
+
+    def _finish_response(self, status, response_headers, content,
+                         num_redirects = 0, prefetch = False):
         # NOTE: Step 4: Handle possible redirects
         if status.startswith("3") and "location" in response_headers:
             url = response_headers["location"]
 
-            if "://" not in url:
-                url = f"{self.scheme}://{self.host}{url}"
+            if "://" not in url: # Keeps the port, unlike scheme://host/path
+                url = str(self.resolve(url))
 
             if num_redirects < MAX_REDIRECTS:
-                return URL(url).request(num_redirects + 1)
+                return URL(url).request(num_redirects + 1, prefetch)
             else:
                 return "Error: Too many redirects"
 
-        # NOTE: Step 5: Read response body
-        if "content-length" in response_headers:
-            content_length = int(response_headers.get("content-length", 0))
-        else:
-            content_length = -1
-
-        if "transfer-encoding" in response_headers and response_headers["transfer-encoding"] == "chunked":
-            # NOTE: Transfer encoding work like below:
-            # <chunk-size in hex>\r\n
-            # <chunk-data>\r\n
-            content = b""
-            while True:
-                size = response.readline().strip().decode("utf-8")
-                if size == "0" or not size:
-                    response.readline()
-                    break
-
-                chunck_size = int(size, 16)
-                line = response.read(chunck_size)
-                response.read(2) # Removes the last \r\n
-                content += line
-        else:
-            content = response.read(content_length)
-
-        # NOTE: Step 6: Decompress body if needed
+        # NOTE: Step 5: Decompress body if needed
         if "content-encoding" in response_headers:
             encoding = response_headers["content-encoding"]
             if encoding in ["gzip", "x-gzip"]:
                 content = gzip.decompress(content)
 
-        # NOTE: Step 7: Decode body to text (utf-8 encoding)
-        content = content.decode("utf-8")
-
-        # NOTE: Step 8: Cache request if allowed
-        if "cache-control" in response_headers and status == "200":
-            cache_directives = self._parse_cache_control(response_headers["cache-control"])
-
-            if "max-age" in cache_directives and "no-store" not in cache_directives:
-                url = f"{self.scheme}://{self.host}{self.path}"
-
-                cache[url] = {
-                    "content": content,
-                    "max-age": int(cache_directives["max-age"]),
-                    "timestamp": time.time()
-                }
+        # NOTE: Step 6: Decode body to text (Content-Type charset or sniffed)
+        content = decode_body(content, response_headers.get("content-type"))
+
+        # NOTE: Step 7: Cache request if allowed
+        # Prefetched responses without a max-age are kept briefly for the
+        # navigation that follows, unless they may not be reused at all
+        if status == "200":
+            cache_directives = {}
+            if "cache-control" in response_headers:
+                cache_directives = self._parse_cache_control(response_headers["cache-control"])
+
+            max_age = cache_directives.get("max-age")
+            if "no-store" in cache_directives:
+                pass
+            elif max_age is not None:
+                cache.put(self._cache_key(), content, ttl=int(max_age))
+            elif prefetch and "no-cache" not in cache_directives and \
+                    "private" not in cache_directives:
+                prefetched.put(self._cache_key(), content)
 
         return content
 
@@ -240,3 +296,175 @@ class URL:
                 cache_control[directive] = True
 
         return cache_control
+
+
+def cached_response(key, prefetch = False):
+    content = cache.get(key)
+    if content is not None:
+        return content
+    # Another prefetch leaves the body for the navigation, which takes it
+    if prefetch:
+        return prefetched.get(key)
+    return prefetched.pop(key)
+
+def read_response(response):
+    # Reads one response off a socket file, leaving it at the start of the
+    # next one. Raises ConnectionError when the server closed the connection
+    statusline = response.readline().decode("utf-8")
+    if not statusline:
+        raise ConnectionError("Connection closed")
+    try:
+        version, status, explanation = statusline.split(" ", 2)
+    except ValueError:
+        raise ConnectionError(f"Malformed statusline: {statusline!r}")
+
+    response_headers = {}
+    while True:
+        line = response.readline()
+        if line in (b"\r\n", b"\n"): break
+        if not line:
+            raise ConnectionError("Connection closed in headers")
+        header_line = line.decode("utf-8").strip()
+        header, value = header_line.split(":", 1)
+        response_headers[header.casefold()] = value.strip()
+
+    if response_headers.get("transfer-encoding") == "chunked":
+        # NOTE: Transfer encoding work like below:
+        # <chunk-size in hex>\r\n
+        # <chunk-data>\r\n
+        content = b""
+        while True:
+            size = response.readline().strip().decode("utf-8")
+            if not size: break
+            # The size can be followed by extensions, e.g. "0;name=value"
+            chunck_size = int(size.split(";", 1)[0].strip(), 16)
+            if chunck_size == 0:
+                # Skips any trailer fields up to the blank line
+                while response.readline() not in (b"\r\n", b"\n", b""): pass
+                break
+
+            chunk = response.read(chunck_size)
+            if len(chunk) < chunck_size:
+                raise ConnectionError("Connection closed in body")
+            response.read(2) # Removes the last \r\n
+            content += chunk
+    elif "content-length" in response_headers:
+        content_length = int(response_headers["content-length"])
+        content = response.read(content_length)
+        if len(content) < content_length:
+            raise ConnectionError("Connection closed in body")
+    else:
+        content = response.read()
+
+    return status, response_headers, content
+
+def keeps_alive(response_headers):
+    if response_headers.get("connection", "").casefold() == "close":
+        return False
+    return "content-length" in response_headers or \
+        response_headers.get("transfer-encoding") == "chunked"
+
+# NOTE: HTTP/1.1 pipelining: every GET for one origin is written back to back
+# on a single connection and the responses are read in order, so the round
+# trips overlap instead of queuing behind each other. Only GETs are sent,
+# which are safe to repeat, so anything the server didn't answer (it closed
+# the connection, or sent something unparsable) is simply left out and can
+# be requested again on its own.
+def pipeline(urls, prefetch = False):
+    # Returns {index into urls: content} for the responses that came back
+    results = {}
+    origins = {}
+    for i, url in enumerate(urls):
+        if url.is_malformed or url.scheme not in ["http", "https"]:
+            continue
+        cached_content = cached_response(url._cache_key(), prefetch)
+        if cached_content is not None:
+            tracer.count("HTTP cache hits")
+            results[i] = cached_content
+            continue
+        tracer.count("HTTP cache misses")
+        origins.setdefault((url.scheme, url.host, url.port), []).append(i)
+
+    for address, indices in origins.items():
+        for start in range(0, len(indices), PIPELINE_DEPTH):
+            batch = indices[start:start + PIPELINE_DEPTH]
+            with tracer.span("URL.pipeline", host=address[1], requests=len(batch)):
+                _pipeline_batch(address, [(i, urls[i]) for i in batch], results, prefetch)
+    return results
+
+def _pipeline_batch(address, batch, results, prefetch):
+    s = sockets.pop(address, None)
+    if s is None or s.fileno() == -1:
+        try:
+            s = batch[0][1]._connect()
+        except OSError:
+            return
+
+    responses = []
+    alive = False
+    try:
+        s.sendall(b"".join([url._build_request() for _, url in batch]))
+        response = s.makefile("rb")
+        for i, url in batch:
+            status, response_headers, content = read_response(response)
+            responses.append((i, url, status, response_headers, content))
+            alive = keeps_alive(response_headers)
+            if not alive: break
+    except (OSError, ConnectionError, ValueError):
+        alive = False
+
+    if alive:
+        sockets[address] = s
+    else:
+        s.close()
+
+    # Redirects are followed only after the socket is back in the pool. A
+    # response that fails here (a redirect to a dead host, a broken gzip
+    # body) is left out, so it's requested again on its own like the rest
+    for i, url, status, response_headers, content in responses:
+        try:
+            results[i] = url._finish_response(status, response_headers, content,
+                                              prefetch=prefetch)
+        except Exception:
+            continue
+
+def request_pipelined(urls, prefetch = False):
+    # Like calling request() on every url, but pipelining where possible
+    results = pipeline(urls, prefetch)
+    return [results[i] if i in results else url.request(prefetch=prefetch)
+            for i, url in enumerate(urls)]
+
+
+def charset_from(value):
+    # Normalized codec name, or None if Python doesn't know it
+    try:
+        return codecs.lookup(value).name
+    except LookupError:
+        return None
+
+def sniff_charset(data, content_type = None):
+    # Returns (encoding, length of the byte order mark to skip)
+    head = bytes(data[:SNIFF_BYTES])
+    for bom, encoding in BOMS:
+        if head.startswith(bom):
+            return encoding, len(bom)
+
+    if content_type and "charset=" in content_type.casefold():
+        value = content_type.casefold().split("charset=", 1)[1]
+        encoding = charset_from(value.split(";", 1)[0].strip(" \"'"))
+        if encoding: return encoding, 0
+
+    match = META_CHARSET.search(head)
+    if match:
+        encoding = charset_from(match.group(1).decode("ascii"))
+        # The <meta> was just read as ASCII, so a declared UTF-16/32 can't be
+        # right; HTML's sniffing rules treat it as UTF-8
+        if encoding and encoding.startswith(("utf-16", "utf-32")):
+            encoding = "utf-8"
+        if encoding: return encoding, 0
+    return "utf-8", 0
+
+def decode_body(data, content_type = None):
+    encoding, bom = sniff_charset(data, content_type)
+    with memoryview(data)[bom:] as view:
+        return str(view, encoding, "replace")
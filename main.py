@@ -1,11 +1,15 @@
 import sys
-import tkinter
-from browser.gui import Browser
 from browser.url import URL
+from browser.loader import LoadTask, start_task
 
 if __name__ == "__main__":
     default_url = "file://data/homepage.html"
     url_str = sys.argv[1] if len(sys.argv) > 1 else default_url
 
-    Browser().new_tab(URL(url_str))
-    tkinter.mainloop()
+    # Start fetching the first page while Tk and the window are set up
+    task = start_task(LoadTask(None, URL(url_str)))
+
+    from browser.gui import Browser
+    browser = Browser()
+    browser.new_tab(task.url, task)
+    browser.window.mainloop()
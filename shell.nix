@@ -3,7 +3,6 @@
 pkgs.mkShell {
   packages = [
     (pkgs.python3.withPackages(p: with p; [
-      emoji
       tkinter
       pillow
     ]))